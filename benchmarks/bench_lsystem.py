@@ -0,0 +1,23 @@
+# L-System derivation and interpretation at increasing iteration counts, on the tree main.py shows
+from benchmarks.common import measure
+
+from main.loader import lcr_loader
+from main.lsystems.parser import LSystemGenerator
+
+TREE = 'data/scenes/basic_tree.lcr'
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    iterations = (2, 3, 4) if quick else (2, 3, 4, 5, 6)
+    for i in iterations:
+        lsystem = lcr_loader.load_lsystem(TREE)
+        lsystem.iterations = i
+        generator = LSystemGenerator(lsystem)
+        results['generate_sequence_%d' % i] = measure(generator.generate_sequence, repeat=3)
+        results['generate_sequence_%d' % i]['symbols'] = len(generator.sequence)
+        # interprets the sequence generate_sequence left behind
+        results['generate_system_%d' % i] = measure(generator.generate_system, repeat=3, warmup=False)
+        results['generate_system_batched_%d' % i] = measure(lambda: generator.generate_system(batched=True),
+                                                            repeat=3, warmup=False)
+    return results
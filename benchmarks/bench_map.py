@@ -0,0 +1,63 @@
+# brush geometry, .tmf chunk (de)serialization and the map compiler, on a generated map of box brushes
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import measure
+
+from main.core.scene_geometry import Brush
+from main.loader.scene.scene_types import RawVertex, RawFace, RawPlane, VertexChunk, FaceChunk, PlaneChunk
+from main.util.tools import map_compiler
+
+TEXTURE = 'defaults/default'  # has to be in data/textures/texturecache.txt
+
+
+def box_sides(low, high):
+    # the six sides of an axis aligned box, three points each, as a .map writes them
+    (x0, y0, z0), (x1, y1, z1) = low, high
+    side = '( %g %g %g ) ( %g %g %g ) ( %g %g %g ) ' + TEXTURE + ' 0 0 0 1 1 0 0 0'
+    return [side % (x0, y0, z0, x0, y0 + 1, z0, x0, y0, z0 + 1),
+            side % (x0, y0, z0, x0, y0, z0 + 1, x0 + 1, y0, z0),
+            side % (x0, y0, z0, x0 + 1, y0, z0, x0, y0 + 1, z0),
+            side % (x1, y1, z1, x1, y1 + 1, z1, x1 + 1, y1, z1),
+            side % (x1, y1, z1, x1 + 1, y1, z1, x1, y1, z1 + 1),
+            side % (x1, y1, z1, x1, y1, z1 + 1, x1, y1 + 1, z1)]
+
+
+def write_map(filename: str, count: int):
+    rng = np.random.default_rng(0)
+    with open(filename, 'wt', encoding='utf-8') as f:
+        f.write('{\n"classname" "worldspawn"\n')
+        for i in range(count):
+            low = np.array([(i % 16) * 128, (i // 16) * 128, 0])
+            high = low + rng.integers(16, 112, 3)
+            f.write('{\n' + '\n'.join(box_sides(low, high)) + '\n}\n')
+        f.write('}\n')
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    count = 16 if quick else 128
+    with tempfile.TemporaryDirectory() as tmp:
+        map_file = os.path.join(tmp, 'bench.map')
+        write_map(map_file, count)
+        brushes = map_compiler.parse_map_file(map_file)[0]['brushes']
+
+        results['brush_get_vertices'] = measure(brushes[0].get_vertices, number=10)
+        results['brush_get_vertices_%d' % count] = measure(lambda: [b.get_vertices() for b in brushes], repeat=3)
+
+        rng = np.random.default_rng(0)
+        vertices = [RawVertex(rng.normal(size=3), rng.normal(size=3), rng.normal(size=2)) for _ in range(count * 24)]
+        faces = [RawFace(0, i * 4, 4, i * 6, 6, rng.normal(size=3)) for i in range(count * 6)]
+        planes = [RawPlane(rng.normal(size=3), rng.normal(size=3)) for _ in range(count * 6)]
+        for name, chunk in (('vertex', VertexChunk(vertices)), ('face', FaceChunk(faces)),
+                            ('plane', PlaneChunk(planes))):
+            data = bytes(chunk.serialize())
+            results['%s_chunk_serialize' % name] = measure(chunk.serialize)
+            results['%s_chunk_deserialize' % name] = measure(lambda: type(chunk).deserialize(data))
+
+        args = argparse.Namespace(datadir='data', map=map_file, output=os.path.join(tmp, 'bench.tmf'), verbose=False)
+        results['map_compiler_%d' % count] = measure(lambda: map_compiler.main(args), repeat=3, warmup=False)
+    return results
@@ -0,0 +1,29 @@
+# vertex_math normal generation, flat (per triangle) and smooth (per vertex), on a bumpy grid
+import numpy as np
+
+from benchmarks.common import measure
+
+from main.math import vertex_math
+
+
+def grid(size: int):
+    # (size * size, 3) positions and (2 * (size - 1) ** 2, 3) triangles
+    rng = np.random.default_rng(0)
+    xs, ys = np.meshgrid(np.arange(size), np.arange(size))
+    positions = np.stack([xs.ravel(), ys.ravel(), rng.normal(size=size * size) * 0.3], axis=1).astype('float32')
+    corner = (np.arange(size - 1)[:, np.newaxis] * size + np.arange(size - 1)).ravel()
+    faces = np.concatenate([np.stack([corner, corner + 1, corner + size], axis=1),
+                            np.stack([corner + 1, corner + size + 1, corner + size], axis=1)])
+    return positions, faces
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    for size in ((32, 128) if quick else (32, 128, 512)):
+        positions, faces = grid(size)
+        triangles = positions[faces].ravel()
+        results['flat_%d' % len(faces)] = measure(lambda: vertex_math.get_normals(triangles))
+        results['smooth_%d' % len(faces)] = measure(lambda: vertex_math.get_normals_from_obj(positions, faces))
+        results['smooth_area_weighted_%d' % len(faces)] = measure(
+            lambda: vertex_math.get_vertex_normals(positions, faces, area_weighted=True))
+    return results
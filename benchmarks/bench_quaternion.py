@@ -0,0 +1,75 @@
+# times main.math.quaternion against the scipy Rotation calls it replaced, run from the repo root:
+# python -m benchmarks.bench_quaternion
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from benchmarks.common import measure
+from main.math import quaternion, matrix
+from main.math.transform import Transform
+
+BATCH = 10000
+
+
+def scipy_translate_local(t: Transform, trans_vec: np.ndarray):
+    # Transform.translate_local the way it was, through scipy
+    rot = np.identity(4)
+    rot[:3, :3] = R.from_quat(t.get_rotation()).as_matrix()
+    position_mat = matrix.create_translation_matrix(t.get_translation()).dot(
+        rot.dot(matrix.create_translation_matrix(trans_vec)))
+    t.set_translation(matrix.translation_from_matrix(position_mat))
+
+
+def scipy_rotate_local(t: Transform, rot_quat: np.ndarray):
+    rot = np.identity(4)
+    rot[:3, :3] = R.from_quat(t.get_rotation()).as_matrix()
+    delta = np.identity(4)
+    delta[:3, :3] = R.from_quat(rot_quat).as_matrix()
+    position_mat = matrix.create_translation_matrix(t.get_translation()).dot(rot.dot(delta))
+    t.set_rotation(R.from_matrix(position_mat[:3, :3]).as_quat())
+
+
+def cases():
+    # name -> (scipy version, quaternion module version)
+    rng = np.random.default_rng(0)
+    q = rng.normal(size=4)
+    q /= np.linalg.norm(q)
+    m = R.from_quat(q).as_matrix()
+    quats = rng.normal(size=(BATCH, 4))
+    mats = R.from_quat(quats).as_matrix()
+    t = Transform()
+    t.set_rotation(q)
+    step = np.array([0.16, 0.0, 0.0])
+    turn = quaternion.from_axis_angle((0.0, 1.0, 0.0), 0.01)
+    return {
+        'to_matrix': (lambda: R.from_quat(q).as_matrix(), lambda: quaternion.to_matrix(q)),
+        'from_matrix': (lambda: R.from_matrix(m).as_quat(), lambda: quaternion.from_matrix(m)),
+        'from_angles': (lambda: (R.from_euler('y', 0.3) * R.from_euler('z', 0.7)).as_quat(),
+                        lambda: matrix.quaternion_from_angles([0, 0.3, 0.7])),
+        'translate_local': (lambda: scipy_translate_local(t, step), lambda: t.translate_local(step)),
+        'rotate_local': (lambda: scipy_rotate_local(t, turn), lambda: t.rotate_local(turn)),
+        'to_matrices_%d' % BATCH: (lambda: R.from_quat(quats).as_matrix(), lambda: quaternion.to_matrices(quats)),
+        'from_matrices_%d' % BATCH: (lambda: R.from_matrix(mats).as_quat(), lambda: quaternion.from_matrices(mats)),
+    }
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    number = 20 if quick else 200
+    for name, (old, new) in cases().items():
+        calls = max(number // 100, 1) if name.endswith('_%d' % BATCH) else number
+        results[name + '_scipy'] = measure(old, number=calls)
+        results[name] = measure(new, number=calls)
+    return results
+
+
+def main():
+    print('numba: %s' % quaternion.HAS_NUMBA)
+    print('%-22s %12s %12s %8s' % ('', 'scipy (us)', 'new (us)', 'speedup'))
+    results = run()
+    for name in cases():
+        old, new = results[name + '_scipy']['best'], results[name]['best']
+        print('%-22s %12.2f %12.2f %7.1fx' % (name, old * 1e6, new * 1e6, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# frame submission through the recording backend, so no gl context is needed: the time to submit a frame
+# and what it submitted (draws, uniform uploads, state changes), walking the entities and through a compiled scene
+import numpy as np
+
+from benchmarks.common import measure
+from benchmarks.bench_transform import hierarchy
+
+import main.main
+from main.core.scene import Scene
+from main.graphics import shaders, uniforms
+from main.graphics.backend import RecordingBackend, set_backend
+from main.graphics.mesh import Mesh
+
+
+def frame(backend: RecordingBackend, scene: Scene) -> dict:
+    backend.begin_frame()
+    scene.render()
+    return backend.end_frame().as_dict()
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    count = 100 if quick else 1000
+    backend = RecordingBackend()
+    previous = set_backend(backend)
+    # entities stop rendering once the frame is over time, never in here
+    start_time, main.main.RENDER_START_TIME = main.main.RENDER_START_TIME, float('inf')
+    try:
+        shaders.create_branched_programs()
+        meshes = [Mesh() for _ in range(4)]
+        for mesh in meshes:
+            mesh.tri_count = 36
+        main.main.create_uniforms()
+        uniforms.init_all_uniforms()
+
+        root = hierarchy(count, 4, np.random.default_rng(0))
+        stack = list(root.children)
+        while stack:
+            ent = stack.pop()
+            ent.mesh = meshes[len(stack) % len(meshes)]
+            stack.extend(ent.children)
+        scene = Scene('bench')
+        scene.elements = [root]
+
+        results['walk_%d' % count] = measure(lambda: frame(backend, scene), number=3)
+        results['walk_%d' % count]['frame'] = frame(backend, scene)
+        scene.compile()
+        results['compiled_%d' % count] = measure(lambda: frame(backend, scene), number=3)
+        results['compiled_%d' % count]['frame'] = frame(backend, scene)
+    finally:
+        main.main.RENDER_START_TIME = start_time
+        set_backend(previous)
+    return results
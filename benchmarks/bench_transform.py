@@ -0,0 +1,83 @@
+# model and world matrix builds, for single transforms and whole hierarchies
+import numpy as np
+
+from benchmarks.common import measure
+
+from main.core.compiled_scene import CompiledScene
+from main.core.entity import Entity
+from main.math.transform import Transform, TransformPool
+
+
+def random_transform(t: Transform, rng: np.random.Generator):
+    t.set_translation(rng.normal(size=3))
+    t.set_rotation(rng.normal(size=4))
+    t.set_scale(rng.uniform(0.5, 2.0, 3))
+
+
+def hierarchy(count: int, children: int, rng: np.random.Generator) -> Entity:
+    # a tree of count entities below one root
+    root = Entity('root')
+    level = [root]
+    made = 0
+    while made < count:
+        next_level = []
+        for parent in level:
+            for _ in range(children):
+                ent = Entity('node')
+                random_transform(ent.transform, rng)
+                ent.parent = parent
+                parent.children.append(ent)
+                next_level.append(ent)
+                made += 1
+        level = next_level
+    return root
+
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    rng = np.random.default_rng(0)
+    count = 1000 if quick else 10000
+
+    single = Transform()
+
+    def single_build():
+        single.set_translation(np.array([1.0, 2.0, 3.0]))
+        return single.to_model_view_matrix()
+
+    results['model_matrix_single'] = measure(single_build, number=1000)
+
+    pool = TransformPool(count)
+    transforms = [Transform(pool=pool) for _ in range(count)]
+    for t in transforms:
+        random_transform(t, rng)
+
+    def pool_update():
+        pool.dirty[:pool.count] = True
+        pool.update()
+
+    results['model_matrix_pool_%d' % count] = measure(pool_update, number=10)
+
+    root = hierarchy(count, 4, rng)
+    entities = []
+    stack = [root]
+    while stack:
+        ent = stack.pop()
+        entities.append(ent)
+        stack.extend(ent.children)
+
+    def world_matrices():
+        root.invalidate_world()
+        for ent in entities:
+            ent.get_world_matrix()
+
+    results['world_matrix_cached_%d' % count] = measure(world_matrices, number=3)
+    results['world_matrix_static_%d' % count] = measure(lambda: [e.get_world_matrix() for e in entities], number=3)
+
+    compiled = CompiledScene([root])
+
+    def compiled_update():
+        root.invalidate_world()
+        compiled.update()
+
+    results['world_matrix_compiled_%d' % count] = measure(compiled_update, number=3)
+    return results
@@ -0,0 +1,16 @@
+# the modules import each other through main.main (see run.py), so it has to be imported first
+import main.main  # noqa: F401
+
+import timeit
+from typing import Callable, Dict
+
+
+def measure(func: Callable, number: int = 1, repeat: int = 5, warmup: bool = True) -> Dict[str, float]:
+    """
+    Time func: repeat runs of number calls each. Times are seconds per call,
+    the best run is the one to compare between releases, the rest is noise
+    """
+    if warmup:
+        func()
+    runs = [t / number for t in timeit.repeat(func, number=number, repeat=repeat)]
+    return {'best': min(runs), 'mean': sum(runs) / len(runs), 'worst': max(runs), 'number': number, 'repeat': repeat}
@@ -0,0 +1,64 @@
+# runs the benchmark suites headless (nothing here needs a gl context, the render suite draws to a RecordingBackend)
+# and writes the results as json, so releases can be compared. From the repo root:
+# python -m benchmarks.run [--quick] [--suite lsystem --suite map] [--output results.json]
+import argparse
+import contextlib
+import datetime
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SUITES = ['lsystem', 'transform', 'normals', 'map', 'quaternion', 'render']
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_suites(suites, quick: bool = False) -> dict:
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'quick': quick,
+        'suites': {},
+    }
+    for name in suites:
+        # the code under test prints its progress, keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            module = importlib.import_module('benchmarks.bench_' + name)
+            start = time.perf_counter()
+            results = module.run(quick)
+        report['suites'][name] = results
+        print('%s: %d benchmarks in %.1f s' % (name, len(results), time.perf_counter() - start), file=sys.stderr)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tremor benchmarks')
+    parser.add_argument('--suite', dest='suites', action='append', choices=SUITES,
+                        help='run only this suite, can be given more than once')
+    parser.add_argument('--quick', action='store_true', help='smaller inputs, for a quick check')
+    parser.add_argument('--output', type=str, default=None, help='json file to write, stdout if not given')
+    args = parser.parse_args(argv)
+    report = run_suites(args.suites or SUITES, args.quick)
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'wt', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 #version 330
 #define skybox
+#define instanced
 // GLTF: COLOR_0,JOINTS_0,NORMAL,POSITION,TANGENT,TEXCOORD_0,TEXCOORD_1,WEIGHTS_0
 layout(location = 0) in vec3 position;
 layout(location = 1) in vec3 normal;
@@ -10,6 +11,9 @@ layout(location = 5) in vec3 tangent; // hm
 layout(location = 6) in vec3 joints_0; // hm
 layout(location = 7) in vec3 weights_0; // hm
 //*hm: don't know if those are the right types
+#ifdef instanced
+layout(location = 8) in mat4 instanceMatrix; // per-instance model matrix, takes locations 8-11
+#endif
 
 out vec3 fposition;
 out vec3 fnormal;
@@ -36,10 +40,15 @@ mat4 no_translate (mat4 mat) {
 const float stupid_scale = 10000.;
 void main()
 {
+    #ifdef instanced
+    mat4 modelMatrix = modelViewMatrix * instanceMatrix;
+    #else
+    mat4 modelMatrix = modelViewMatrix;
+    #endif
     #ifndef skybox
-    fnormal = (modelViewMatrix * vec4(normal, 0.)).xyz;
-    fposition = vec3(modelViewMatrix * vec4(position, 1.));
-    gl_Position = projectionMatrix * viewMatrix * modelViewMatrix * vec4(position, 1.);
+    fnormal = (modelMatrix * vec4(normal, 0.)).xyz;
+    fposition = vec3(modelMatrix * vec4(position, 1.));
+    gl_Position = projectionMatrix * viewMatrix * modelMatrix * vec4(position, 1.);
     #else
     fnormal = normal;
     fposition = position*stupid_scale;
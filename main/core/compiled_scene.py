@@ -0,0 +1,130 @@
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from main import main
+from main.core.entity import Entity
+from main.core.lod import LODEntity
+from main.graphics.mesh import Mesh
+
+
+class CompiledScene:
+    """
+    A Scene's entity trees flattened into arrays, breadth first so every entity comes after its parent
+    and each depth is one contiguous range. All world matrices are then computed with one batched matmul per depth,
+    and meshes are drawn from flat per-mesh lists instead of by recursing through children.
+    Built by Scene.compile, it has to be compiled again when entities are added, removed, reparented
+    or given a new transform
+    """
+
+    def __init__(self, roots: List[Entity]):
+        self.entities: List[Entity] = []
+        parents: List[int] = []
+        self.depths: List[Tuple[int, int]] = []  # (start, end) of each depth in entities
+        self.custom: List[int] = []  # entities that render themselves, with everything below them
+        level = [(root, -1) for root in roots]
+        while level:
+            start = len(self.entities)
+            next_level = []
+            for ent, parent in level:
+                index = len(self.entities)
+                self.entities.append(ent)
+                parents.append(parent)
+                if type(ent) is not Entity:
+                    # e.g. LODEntity and DAGEntity, which decide what to draw themselves
+                    self.custom.append(index)
+                    continue
+                next_level += [(child, index) for child in ent.children]
+            self.depths.append((start, len(self.entities)))
+            level = next_level
+        self.parents = np.array(parents, dtype='int64')
+        self.world = np.tile(np.identity(4, dtype='float32'), (len(self.entities), 1, 1))
+        # the compiled entities' slots, grouped by pool: (pool, rows in entities, slots in the pool)
+        pools = {}
+        for i, ent in enumerate(self.entities):
+            rows, slots = pools.setdefault(id(ent.transform._pool), (ent.transform._pool, [], []))[1:]
+            rows.append(i)
+            slots.append(ent.transform._index)
+        self.slots = [(pool, np.array(rows), np.array(slots)) for pool, rows, slots in pools.values()]
+        # what world was last computed from: each pool's version, and when each entity's slot had last changed.
+        # The entities' own world caches can't tell if anything moved, get_world_matrix clears them
+        self._versions = [-1] * len(self.slots)
+        self._changed = np.full(len(self.entities), -1, dtype='int64')
+
+        # what gets drawn: each mesh once with all of its entities' matrices, and each instance batch on its own
+        self.draws: Dict[int, Tuple[Mesh, List[int]]] = {}
+        self.instanced: List[int] = []
+        custom = set(self.custom)
+        for i, ent in enumerate(self.entities):
+            if i in custom or not ent.is_renderable():
+                continue
+            if ent.instances is not None:
+                self.instanced.append(i)
+            else:
+                self.draws.setdefault(id(ent.mesh), (ent.mesh, []))[1].append(i)
+        self.draws = {key: (mesh, np.array(indices)) for key, (mesh, indices) in self.draws.items()}
+
+    def _moved(self) -> np.ndarray:
+        # the entities whose own transform changed since the last update
+        moved = np.zeros(len(self.entities), dtype='bool')
+        for p, (pool, rows, slots) in enumerate(self.slots):
+            # nothing in the pool changed at all, the usual case for a static scene
+            if pool.version == self._versions[p]:
+                continue
+            self._versions[p] = pool.version
+            changed = pool.changed[slots]
+            moved[rows] = changed != self._changed[rows]
+            self._changed[rows] = changed
+        return moved
+
+    def _local_matrices(self, moved: np.ndarray) -> np.ndarray:
+        # the model matrices of the moved entities, straight from the transform pools. The other rows are garbage
+        local = np.empty((len(self.entities), 4, 4), dtype='float32')
+        for pool, rows, slots in self.slots:
+            needed = moved[rows]
+            if needed.any():
+                pool.update()
+                local[rows[needed]] = pool.matrices[slots[needed]]
+        return local
+
+    def update(self) -> bool:
+        """
+        Recompute the world matrices of whatever moved and everything below it, and hand them to the entities'
+        caches (see Entity.get_world_matrix). Returns whether anything was recomputed
+        """
+        moved = self._moved()
+        if not moved.any():
+            return False
+        # everything below a moved entity moves with it. Only roots are at depth 0
+        for start, end in self.depths[1:]:
+            moved[start:end] |= moved[self.parents[start:end]]
+        local = self._local_matrices(moved)
+        world = self.world
+        start, end = self.depths[0]
+        roots = start + np.flatnonzero(moved[start:end])
+        world[roots] = local[roots]
+        for start, end in self.depths[1:]:
+            rows = start + np.flatnonzero(moved[start:end])
+            world[rows] = np.matmul(world[self.parents[rows]], local[rows])
+        for i in np.flatnonzero(moved).tolist():
+            ent = self.entities[i]
+            ent._world = world[i]
+            ent._world_dirty = False
+        return True
+
+    def render(self, camera: np.ndarray = None):
+        self.update()
+        for mesh, indices in self.draws.values():
+            if main.exceeded_max_render_time():
+                return
+            mesh.render_matrices(self.world[indices])
+        for i in self.instanced:
+            if main.exceeded_max_render_time():
+                return
+            ent = self.entities[i]
+            ent.mesh.render_instances(ent.transform, ent.instances)
+        for i in self.custom:
+            ent = self.entities[i]
+            if camera is not None and isinstance(ent, LODEntity):
+                ent.select_level(camera)
+            ent.render()
@@ -1,21 +1,71 @@
 import time
 from typing import List
 
+import numpy as np
+
 from main import main
 from main.graphics.mesh import Mesh
+from main.lsystems.instances import InstanceBatch
 from main.math.transform import Transform
 
 
 class Entity:
     def __init__(self, name:str):
+        # world matrix cache, rebuilt when this entity or one of its ancestors moves, see invalidate_world
+        self._world = np.identity(4, dtype='float32')
+        self._world_dirty = True
+        self._parent: Entity = None
+        self._transform: Transform = None
+        self.children: List[Entity] = []
         self.transform:Transform = Transform(self)
         self.mesh: Mesh = None
+        self.instances: InstanceBatch = None  # if set, the mesh is drawn once per instance matrix
         self._node_idx = -1
-        self.children: List[Entity] = []
         self.parent: Entity = None
         self.classname = ""
         self.name = name
 
+    def get_parent(self) -> 'Entity':
+        return self._parent
+
+    def set_parent(self, parent: 'Entity'):
+        self._parent = parent
+        self.invalidate_world()
+
+    parent = property(get_parent, set_parent)
+
+    def get_transform(self) -> Transform:
+        return self._transform
+
+    def set_transform(self, transform: Transform):
+        self._transform = transform
+        transform._elem = self
+        transform._invalidate()
+
+    transform = property(get_transform, set_transform)
+
+    def invalidate_world(self):
+        # this entity's world matrix is stale, and so are those of everything below it
+        stack = [self]
+        while stack:
+            ent = stack.pop()
+            # a clean entity never has a dirty ancestor, so a dirty one's subtree is already dirty
+            if ent._world_dirty and ent is not self:
+                continue
+            ent._world_dirty = True
+            stack.extend(ent.children)
+
+    def get_world_matrix(self) -> np.ndarray:
+        # the model matrix of the transform and all of its parents', only recomputed after something moved
+        if self._world_dirty:
+            local = self.transform.to_model_view_matrix()
+            if self._parent is None:
+                self._world = local
+            else:
+                self._world = self._parent.get_world_matrix().dot(local)
+            self._world_dirty = False
+        return self._world
+
     def __str__(self):
         return self.name + " (Entity-" + str(self.__hash__()) + ")"
 
@@ -24,7 +74,10 @@ class Entity:
             # print('overtime at entity level!')
             return
         if self.is_renderable():
-            self.mesh.render(self.transform)
+            if self.instances is not None:
+                self.mesh.render_instances(self.transform, self.instances)
+            else:
+                self.mesh.render(self.transform)
         for c in self.children:
             c.render()
 
@@ -0,0 +1,34 @@
+from bisect import bisect
+from typing import List
+
+import numpy as np
+
+from main import main
+from main.core.entity import Entity
+
+
+class LODEntity(Entity):
+    """
+    Holds several versions of the same thing, from most to least detailed, and only draws one of them.
+    Scene.render picks it from the distance to the camera, see select_level
+    """
+
+    def __init__(self, name: str, levels: List[Entity], distances: List[float]):
+        Entity.__init__(self, name)
+        self.levels = levels
+        self.distances = distances  # camera distance each level starts at, increasing (the first should be 0)
+        self.level = 0
+        for level in self.levels:
+            level.parent = self
+
+    def select_level(self, camera_position: np.ndarray):
+        position = self.transform.to_model_view_matrix_global()[:3, 3]
+        distance = np.linalg.norm(np.asarray(camera_position)[:3] - position)
+        self.level = min(max(bisect(self.distances, distance) - 1, 0), len(self.levels) - 1)
+
+    def render(self):
+        if main.exceeded_max_render_time():
+            return
+        if len(self.levels) > 0:
+            self.levels[self.level].render()
+        Entity.render(self)
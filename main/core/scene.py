@@ -1,7 +1,9 @@
 from typing import List
 
 from main import main
+from main.core.compiled_scene import CompiledScene
 from main.core.entity import Entity
+from main.core.lod import LODEntity
 from main.graphics.vbo import VertexBufferObject
 from OpenGL.GL import *
 
@@ -11,12 +13,25 @@ class Scene:
         self.name = name
         self.elements: List[Entity] = []
         self.active_camera: Entity = None
+        self.compiled: CompiledScene = None  # if set, rendered instead of walking the elements, see compile
+
+    def compile(self) -> CompiledScene:
+        # flatten the elements for rendering, again whenever entities are added, removed, reparented or given
+        # a new transform
+        self.compiled = CompiledScene(self.elements)
+        return self.compiled
 
     def tick(self):
         pass
 
     def render(self):
+        camera = self.active_camera.transform.get_translation() if self.active_camera is not None else None
+        if self.compiled is not None:
+            self.compiled.render(camera)
+            return
         for element in self.elements:
+            if camera is not None and isinstance(element, LODEntity):
+                element.select_level(camera)
             element.render()
             # if main.exceeded_max_render_time():
                 # print('exceeded max render time at Scene level!')
@@ -32,6 +32,13 @@ class Plane:
         n = norm_vec3(np.cross((v1 - v0), (v2 - v0)))
         return Plane(v0, n)
 
+    @staticmethod
+    def plane_from_points_quake_style(points) -> "Plane":
+        # .map brush sides list three points clockwise seen from outside, the normal points out of the brush
+        v0, v1, v2 = points
+        n = norm_vec3(np.cross((v0 - v1), (v2 - v1)))
+        return Plane(v1, n)
+
     def point_dist(self, point: np.ndarray):
         return self.normal.dot(point - self.point)
 
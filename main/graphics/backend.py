@@ -0,0 +1,322 @@
+import itertools
+from typing import Callable, List, Dict, Optional, Tuple
+
+import OpenGL.GL as GL
+from OpenGL.GL.shaders import ShaderCompilationError
+
+
+class GLBackend:
+    """
+    Every gl call the renderer makes for meshes, shaders, uniforms and textures goes through the current backend
+    (see get_backend). This one passes them straight to PyOpenGL. Swap it for a RecordingBackend with set_backend
+    to count what a frame submits, with or without a gl context
+    """
+
+    # resources
+    def gen_vertex_array(self) -> int:
+        return GL.glGenVertexArrays(1)
+
+    def gen_buffer(self) -> int:
+        return GL.glGenBuffers(1)
+
+    def buffer_data(self, target: int, size: int, data, usage: int):
+        GL.glBufferData(target, size, data, usage)
+
+    def delete_buffer(self, buffer: int):
+        GL.glDeleteBuffers(1, [buffer])
+
+    def gen_texture(self) -> int:
+        return GL.glGenTextures(1)
+
+    def tex_image_2d(self, target: int, level: int, internal_format: int, width: int, height: int, img_format: int,
+                     data_type: int, data):
+        GL.glTexImage2D(target, level, internal_format, width, height, 0, img_format, data_type, data)
+
+    def generate_mipmap(self, target: int):
+        GL.glGenerateMipmap(target)
+
+    def tex_parameter(self, target: int, name: int, value):
+        if isinstance(value, float):
+            GL.glTexParameterf(target, name, value)
+        else:
+            GL.glTexParameteri(target, name, value)
+
+    def create_shader(self, shader_type: int, source: str) -> int:
+        shader = GL.glCreateShader(shader_type)
+        GL.glShaderSource(shader, source)
+        GL.glCompileShader(shader)
+        if GL.glGetShaderiv(shader, GL.GL_COMPILE_STATUS) == GL.GL_FALSE:
+            raise ShaderCompilationError(
+                "Compilation failure for %s\n%s" % (str(shader_type), GL.glGetShaderInfoLog(shader).decode()))
+        return shader
+
+    def delete_shader(self, shader: int):
+        GL.glDeleteShader(shader)
+
+    def create_program(self, vertex: int, fragment: int) -> Tuple[int, Optional[str]]:
+        # the linked program, and the linker log if it failed
+        program = GL.glCreateProgram()
+        GL.glAttachShader(program, vertex)
+        GL.glAttachShader(program, fragment)
+        GL.glLinkProgram(program)
+        if GL.glGetProgramiv(program, GL.GL_LINK_STATUS) == GL.GL_FALSE:
+            return program, str(GL.glGetProgramInfoLog(program))
+        return program, None
+
+    def get_uniform_location(self, program: int, name: str) -> int:
+        return GL.glGetUniformLocation(program, name)
+
+    def get_attrib_location(self, program: int, name: str) -> int:
+        return GL.glGetAttribLocation(program, name)
+
+    # state
+    def use_program(self, program: int):
+        GL.glUseProgram(program)
+
+    def bind_vertex_array(self, vao: int):
+        GL.glBindVertexArray(vao)
+
+    def bind_buffer(self, target: int, buffer: int):
+        GL.glBindBuffer(target, buffer)
+
+    def uniform(self, func: Callable, args: list):
+        # func is the glUniform* function for the uniform's type, see uniforms.u_types
+        func(*args)
+
+    def active_texture(self, unit: int):
+        GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+
+    def bind_texture(self, target: int, texture: int):
+        GL.glBindTexture(target, texture)
+
+    def vertex_attrib_pointer(self, location: int, size: int, data_type: int, normalized: bool, stride: int,
+                              offset, divisor: int = 0):
+        GL.glEnableVertexAttribArray(location)
+        GL.glVertexAttribPointer(location, size, data_type, normalized, stride, offset)
+        if divisor:
+            GL.glVertexAttribDivisor(location, divisor)
+
+    # drawing
+    def draw_elements(self, mode: int, count: int, index_type: int, instances: int = 1):
+        if instances == 1:
+            GL.glDrawElements(mode, count, index_type, None)
+        else:
+            GL.glDrawElementsInstanced(mode, count, index_type, None, instances)
+
+    def draw_arrays(self, mode: int, first: int, count: int, instances: int = 1):
+        if instances == 1:
+            GL.glDrawArrays(mode, first, count)
+        else:
+            GL.glDrawArraysInstanced(mode, first, count, instances)
+
+    def clear(self, r: float, g: float, b: float, a: float):
+        GL.glClearColor(r, g, b, a)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+
+    # frames, see scene_renderer.render
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class FrameStats:
+    """
+    What one frame submitted. Every kind of binding is counted the same way: a switch changes what is bound,
+    unbinding (binding 0) included, and a redundant bind rebinds what already is. The redundant ones are what
+    batching and sorting by state should get rid of
+    """
+
+    def __init__(self):
+        self.draws = 0
+        self.instances = 0  # drawn in total, a plain draw is one
+        self.vertices = 0  # drawn in total, over all instances
+        self.uniform_uploads = 0
+        self.program_switches = 0
+        self.redundant_program_binds = 0
+        self.buffer_switches = 0
+        self.redundant_buffer_binds = 0
+        self.vao_switches = 0
+        self.redundant_vao_binds = 0
+        self.texture_switches = 0
+        self.redundant_texture_binds = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+    def __str__(self) -> str:
+        return 'FrameStats(%s)' % ', '.join('%s=%d' % item for item in vars(self).items())
+
+
+class RecordingBackend(GLBackend):
+    """
+    Counts the calls of each frame into FrameStats. Without a backend to forward to it's a null backend:
+    nothing reaches gl, so meshes, programs and whole scenes can be set up and rendered without a context,
+    resources get made up handles and every attribute and uniform exists
+    """
+
+    def __init__(self, forward: GLBackend = None, log_calls: bool = False):
+        self.forward = forward
+        self.log_calls = log_calls
+        self.calls: List[Tuple[str, tuple]] = []  # (method, arguments) of the current frame, if log_calls
+        self.frames: List[FrameStats] = []
+        self.current = FrameStats()
+        self._handles = itertools.count(1)
+        self._locations: Dict[Tuple[int, str], int] = {}
+        # what is bound, starting from gl's defaults
+        self._program = 0
+        self._vao = 0
+        self._buffers: Dict[int, int] = {}  # by target
+        self._unit = 0
+        self._textures: Dict[Tuple[int, int], int] = {}  # by (unit, target)
+
+    def _record(self, name: str, *args):
+        if self.log_calls:
+            self.calls.append((name, args))
+        if self.forward is not None:
+            return getattr(self.forward, name)(*args)
+        return None
+
+    def _handle(self, name: str, *args):
+        handle = self._record(name, *args)
+        return next(self._handles) if self.forward is None else handle
+
+    # resources
+    def gen_vertex_array(self) -> int:
+        return self._handle('gen_vertex_array')
+
+    def gen_buffer(self) -> int:
+        return self._handle('gen_buffer')
+
+    def buffer_data(self, target: int, size: int, data, usage: int):
+        self._record('buffer_data', target, size, data, usage)
+
+    def delete_buffer(self, buffer: int):
+        # gl unbinds a buffer that is deleted while bound
+        for target, bound in list(self._buffers.items()):
+            if bound == buffer:
+                self._buffers[target] = 0
+        self._record('delete_buffer', buffer)
+
+    def gen_texture(self) -> int:
+        return self._handle('gen_texture')
+
+    def tex_image_2d(self, target: int, level: int, internal_format: int, width: int, height: int, img_format: int,
+                     data_type: int, data):
+        self._record('tex_image_2d', target, level, internal_format, width, height, img_format, data_type, data)
+
+    def generate_mipmap(self, target: int):
+        self._record('generate_mipmap', target)
+
+    def tex_parameter(self, target: int, name: int, value):
+        self._record('tex_parameter', target, name, value)
+
+    def create_shader(self, shader_type: int, source: str) -> int:
+        return self._handle('create_shader', shader_type, source)
+
+    def delete_shader(self, shader: int):
+        self._record('delete_shader', shader)
+
+    def create_program(self, vertex: int, fragment: int) -> Tuple[int, Optional[str]]:
+        if self.forward is not None:
+            return self._record('create_program', vertex, fragment)
+        self._record('create_program', vertex, fragment)
+        return next(self._handles), None
+
+    def get_uniform_location(self, program: int, name: str) -> int:
+        if self.forward is not None:
+            return self._record('get_uniform_location', program, name)
+        return self._locations.setdefault((program, name), len(self._locations))
+
+    def get_attrib_location(self, program: int, name: str) -> int:
+        if self.forward is not None:
+            return self._record('get_attrib_location', program, name)
+        return self._locations.setdefault((program, name), len(self._locations))
+
+    # state
+    def use_program(self, program: int):
+        if program == self._program:
+            self.current.redundant_program_binds += 1
+        else:
+            self.current.program_switches += 1
+            self._program = program
+        self._record('use_program', program)
+
+    def bind_vertex_array(self, vao: int):
+        if vao == self._vao:
+            self.current.redundant_vao_binds += 1
+        else:
+            self.current.vao_switches += 1
+            self._vao = vao
+        self._record('bind_vertex_array', vao)
+
+    def bind_buffer(self, target: int, buffer: int):
+        if self._buffers.get(target, 0) == buffer:
+            self.current.redundant_buffer_binds += 1
+        else:
+            self.current.buffer_switches += 1
+            self._buffers[target] = buffer
+        self._record('bind_buffer', target, buffer)
+
+    def uniform(self, func: Callable, args: list):
+        self.current.uniform_uploads += 1
+        self._record('uniform', func, args)
+
+    def active_texture(self, unit: int):
+        self._unit = unit
+        self._record('active_texture', unit)
+
+    def bind_texture(self, target: int, texture: int):
+        if self._textures.get((self._unit, target), 0) == texture:
+            self.current.redundant_texture_binds += 1
+        else:
+            self.current.texture_switches += 1
+            self._textures[(self._unit, target)] = texture
+        self._record('bind_texture', target, texture)
+
+    def vertex_attrib_pointer(self, location: int, size: int, data_type: int, normalized: bool, stride: int,
+                              offset, divisor: int = 0):
+        self._record('vertex_attrib_pointer', location, size, data_type, normalized, stride, offset, divisor)
+
+    # drawing
+    def draw_elements(self, mode: int, count: int, index_type: int, instances: int = 1):
+        self.current.draws += 1
+        self.current.instances += instances
+        self.current.vertices += count * instances
+        self._record('draw_elements', mode, count, index_type, instances)
+
+    def draw_arrays(self, mode: int, first: int, count: int, instances: int = 1):
+        self.current.draws += 1
+        self.current.instances += instances
+        self.current.vertices += count * instances
+        self._record('draw_arrays', mode, first, count, instances)
+
+    def clear(self, r: float, g: float, b: float, a: float):
+        self._record('clear', r, g, b, a)
+
+    # frames
+    def begin_frame(self):
+        self.current = FrameStats()
+        self.calls = []
+        self._record('begin_frame')
+
+    def end_frame(self) -> FrameStats:
+        self._record('end_frame')
+        self.frames.append(self.current)
+        return self.current
+
+
+_backend: GLBackend = GLBackend()
+
+
+def get_backend() -> GLBackend:
+    return _backend
+
+
+def set_backend(backend: GLBackend) -> GLBackend:
+    # use another backend from now on, returns the previous one. Resources made with one backend
+    # are meaningless to another, so swap before anything is loaded (or forward to the old one)
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
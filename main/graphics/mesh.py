@@ -1,18 +1,24 @@
+import copy
 import ctypes
+from typing import Dict
 
 import OpenGL.GL as GL
 
 from main.graphics import shaders
+from main.graphics.backend import get_backend
 from main.graphics.shaders import MeshProgram
 from main.graphics.surfaces import Material
+from main.graphics.vbo import VertexBufferObject
+from main.lsystems.instances import InstanceBatch
 from main.math.transform import Transform
 import numpy as np
 
 
 class Mesh:
     def __init__(self):
-        self.vaoID = GL.glGenVertexArrays(1)
+        self.vaoID = get_backend().gen_vertex_array()
         self.program:MeshProgram = shaders.get_default_program()
+        self.branched_program = 'default'
         self.gl_program = self.program.program
         self.scene_model = None
         self.material:Material = self.program.create_material()
@@ -21,45 +27,64 @@ class Mesh:
         self.element = False # is elemented
         self.elementBufID = 0
         self.elementInfo = None
+        self.index_count = 0
+        self.index_type = GL.GL_UNSIGNED_SHORT
+        # cpu copies of the vertex attributes (by shader attribute name) and indices, for baking
+        self.vertex_data: Dict[str, np.ndarray] = {}
+        self.indices: np.ndarray = None
 
     def bind_vao(self):
         if self.vaoID is None:
-            self.vaoID = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vaoID)
+            self.vaoID = get_backend().gen_vertex_array()
+        get_backend().bind_vertex_array(self.vaoID)
 
     def unbind_vao(self):
-        GL.glBindVertexArray(0)
+        get_backend().bind_vertex_array(0)
 
     def set_shader (self, shader:MeshProgram):
         self.program = shader
         self.gl_program = self.program.program
 
     def find_shader (self, name:str):
+        self.branched_program = name
         self.program = shaders.query_branched_program(name, self.material)
         self.gl_program = self.program.program
 
     def create_material (self, name:str=None):
         self.material = self.program.create_material(name)
     def use_program (self):
-        GL.glUseProgram(self.gl_program)
+        get_backend().use_program(self.gl_program)
     def render(self, transform: Transform):
+        self.render_matrix(transform.to_model_view_matrix_global())
+
+    def render_matrix(self, model_mat: np.ndarray):
+        self.bind_vao()
+        get_backend().use_program(self.gl_program)
+        self.program.update_uniform('modelViewMatrix', [1, GL.GL_FALSE, model_mat.transpose()])
+        self.program.use_material(self.material)
+        self.draw()
+
+    def render_instances(self, transform: Transform, instances: InstanceBatch):
+        # no instancing here: one draw per instance, but the state is only set up once
+        self.render_matrices(np.matmul(transform.to_model_view_matrix_global(), instances.matrices))
+
+    def render_matrices(self, model_mats: np.ndarray):
+        # one draw per model matrix, with the vao, program and material set up once
         self.bind_vao()
-        GL.glUseProgram(self.gl_program)
-        self.program.update_uniform('modelViewMatrix',
-                                    [1, GL.GL_FALSE, transform.to_model_view_matrix_global().transpose()])
+        get_backend().use_program(self.gl_program)
         self.program.use_material(self.material)
+        for model_mat in model_mats:
+            self.program.update_uniform('modelViewMatrix', [1, GL.GL_FALSE, model_mat.transpose()])
+            self.draw()
+
+    def draw(self):
+        backend = get_backend()
         if self.element:
-            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elementBufID)
-            # mode,count,type,indices
-            GL.glDrawElements(GL.GL_TRIANGLES,
-                              self.elementInfo.count,
-                              GL.GL_UNSIGNED_SHORT,
-                              None
-                              )
+            backend.bind_buffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elementBufID)
+            # mode,count,type
+            backend.draw_elements(GL.GL_TRIANGLES, self.index_count, self.index_type)
         else:
-            GL.glDrawArrays(GL.GL_TRIANGLES,
-                            0,
-                            self.tri_count)
+            backend.draw_arrays(GL.GL_TRIANGLES, 0, self.tri_count)
 
     @staticmethod
     def create_blank_square () -> 'Mesh':
@@ -75,32 +100,108 @@ class Mesh:
             0, 0,  1, 1,  0, 1,
             0, 0,  1, 0,  1, 1
         ], dtype='float32')
-        pos_buf = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, pos_buf)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, len(positions) * 4, positions, GL.GL_STATIC_DRAW)
-        position_location = GL.glGetAttribLocation(mesh.gl_program, 'position')
-        GL.glEnableVertexAttribArray(position_location)
-        GL.glVertexAttribPointer(position_location,
-                                 3,
-                                 GL.GL_FLOAT,
-                                 GL.GL_FALSE,
-                                 0,
-                                 ctypes.c_void_p(0)
-                                )
-
-        uv_buf = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, uv_buf)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, len(uvs) * 4, uvs, GL.GL_STATIC_DRAW)
-        position_location = GL.glGetAttribLocation(mesh.gl_program, 'texcoord_0')
-        GL.glEnableVertexAttribArray(position_location)
-        GL.glVertexAttribPointer(position_location,
-                                 2,
-                                 GL.GL_FLOAT,
-                                 GL.GL_FALSE,
-                                 0,
-                                 ctypes.c_void_p(0)
-                                 )
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        backend = get_backend()
+        pos_buf = backend.gen_buffer()
+        backend.bind_buffer(GL.GL_ARRAY_BUFFER, pos_buf)
+        backend.buffer_data(GL.GL_ARRAY_BUFFER, len(positions) * 4, positions, GL.GL_STATIC_DRAW)
+        position_location = backend.get_attrib_location(mesh.gl_program, 'position')
+        backend.vertex_attrib_pointer(position_location, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, ctypes.c_void_p(0))
+
+        uv_buf = backend.gen_buffer()
+        backend.bind_buffer(GL.GL_ARRAY_BUFFER, uv_buf)
+        backend.buffer_data(GL.GL_ARRAY_BUFFER, len(uvs) * 4, uvs, GL.GL_STATIC_DRAW)
+        position_location = backend.get_attrib_location(mesh.gl_program, 'texcoord_0')
+        backend.vertex_attrib_pointer(position_location, 2, GL.GL_FLOAT, GL.GL_FALSE, 0, ctypes.c_void_p(0))
+        backend.bind_buffer(GL.GL_ARRAY_BUFFER, 0)
         mesh.unbind_vao()
         return mesh
 
+
+class InstancedMesh(Mesh):
+    """
+    Draws every instance of another mesh with a single instanced draw call.
+    The per-instance model matrices live in a vertex buffer that the 'instanced' vertex shader flag reads
+    """
+    INSTANCE_MATRIX_LOCATION = 8  # see instanceMatrix in the default vertex shader, it takes 4 locations
+
+    def __init__(self, mesh: Mesh):
+        # share the vao and buffers of the source mesh instead of creating new ones in Mesh.__init__
+        self.vaoID = mesh.vaoID
+        self.scene_model = mesh.scene_model
+        self.tri_count = mesh.tri_count
+        self.element = mesh.element
+        self.elementBufID = mesh.elementBufID
+        self.elementInfo = mesh.elementInfo
+        self.index_count = mesh.index_count
+        self.index_type = mesh.index_type
+        self.vertex_data = mesh.vertex_data
+        self.indices = mesh.indices
+        self.material: Material = copy.deepcopy(mesh.material)
+        self.material.add_flag('instanced')
+        self.find_shader(mesh.branched_program)
+        self.instance_vbo = VertexBufferObject()
+        self.instance_count = 0
+        self._uploaded_version = -1
+        self._uploaded_batch = None
+
+    def update_instances(self, instances: InstanceBatch):
+        # glsl reads a mat4 attribute column by column, so upload the transposed matrices
+        self.instance_vbo.update_data(np.ascontiguousarray(instances.matrices.transpose(0, 2, 1)))
+        self.instance_count = len(instances)
+        self._uploaded_version = instances.version
+        self._uploaded_batch = instances
+
+    def render_instances(self, transform: Transform, instances: InstanceBatch):
+        if instances is not self._uploaded_batch or instances.version != self._uploaded_version:
+            self.update_instances(instances)
+        self.render_matrix(transform.to_model_view_matrix_global())
+
+    def draw(self):
+        if self.instance_count == 0:
+            return
+        # the vao is shared with the source mesh, so point the instance attributes at our buffer every draw
+        backend = get_backend()
+        self.instance_vbo.bind()
+        for column in range(4):
+            location = InstancedMesh.INSTANCE_MATRIX_LOCATION + column
+            backend.vertex_attrib_pointer(location, 4, GL.GL_FLOAT, GL.GL_FALSE, 64, ctypes.c_void_p(column * 16), 1)
+        self.instance_vbo.unbind()
+        if self.element:
+            backend.bind_buffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elementBufID)
+            backend.draw_elements(GL.GL_TRIANGLES, self.index_count, self.index_type, self.instance_count)
+        else:
+            backend.draw_arrays(GL.GL_TRIANGLES, 0, self.tri_count, self.instance_count)
+
+
+class BakedMesh(Mesh):
+    """
+    Baked geometry (see lsystems.bake) in one interleaved vertex buffer and one index buffer,
+    drawn with the material and shader of one of the meshes that went into it
+    """
+
+    def __init__(self, mesh: Mesh, geometry: 'BakedGeometry'):
+        Mesh.__init__(self)
+        self.material = copy.deepcopy(mesh.material)
+        self.find_shader(mesh.branched_program)
+        self.vbo = VertexBufferObject()
+        self.vbo.update_data(np.ascontiguousarray(geometry.vertices, dtype='float32'))
+        self.bind_vao()
+        self.vbo.bind()
+        backend = get_backend()
+        stride = geometry.stride * 4
+        offset = 0
+        for name, dim in geometry.attributes:
+            location = backend.get_attrib_location(self.gl_program, name)
+            if location != -1:
+                backend.vertex_attrib_pointer(location, dim, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(offset))
+            offset += dim * 4
+        self.vbo.unbind()
+        indices = np.ascontiguousarray(geometry.indices, dtype='uint32')
+        self.elementBufID = backend.gen_buffer()
+        backend.bind_buffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elementBufID)
+        backend.buffer_data(GL.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL.GL_STATIC_DRAW)
+        self.unbind_vao()
+        self.element = True
+        self.index_count = len(indices)
+        self.index_type = GL.GL_UNSIGNED_INT
+        self.tri_count = len(indices) // 3
@@ -6,6 +6,7 @@ from OpenGL.GL import *
 
 from main.core.scene import Scene
 from main.graphics import screen_utils, fbos
+from main.graphics.backend import get_backend
 from main.graphics.fbos import FBO
 from main.graphics.mesh import Mesh
 from main.graphics.uniforms import update_all_uniform
@@ -39,9 +40,10 @@ class FBORenderer:
 flatscreen:Mesh = None
 def render(scene: Scene):
     global framecount, flatscreen
-    glClearColor(0.0, 0.0, 0.0, 0.0)
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glUseProgram(0)
+    backend = get_backend()
+    backend.begin_frame()
+    backend.clear(0.0, 0.0, 0.0, 0.0)
+    backend.use_program(0)
     cam_transform = scene.active_camera.transform.clone()
 
     # reflector = fbos.find_fbo_by_type(FBO.REFLECTION)
@@ -90,3 +92,4 @@ def render(scene: Scene):
     flatscreen.render(Transform.zero())
     """
     framecount += 1
+    backend.end_frame()
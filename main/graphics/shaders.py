@@ -4,6 +4,7 @@ from typing import List
 
 from OpenGL.GL.shaders import ShaderCompilationError
 import OpenGL.GL as gl
+from main.graphics.backend import get_backend
 from main.graphics.surfaces import Material, MaterialTexture
 from main.graphics.uniforms import *
 
@@ -81,7 +82,7 @@ def create_all_programs(filepath='data/shaders/programs.ini',
 
     # delete the shaders
     for shad in list(compiled_vertex_shaders.values()) + list(compiled_fragment_shaders.values()):
-        glDeleteShader(shad)
+        get_backend().delete_shader(shad)
 
 def create_branched_programs(filepath='data/shaders/programs.ini',
                         vertex_location: str = 'data/shaders/vertex',
@@ -134,14 +135,7 @@ def create_branched_programs(filepath='data/shaders/programs.ini',
 
 
 def create_shader(type, source) -> object:
-    shader = glCreateShader(type)
-    glShaderSource(shader, source)
-    glCompileShader(shader)
-    status = glGetShaderiv(shader, GL_COMPILE_STATUS)
-    if status == GL_FALSE:
-        raise ShaderCompilationError(
-            "Compilation failure for %s\n%s" % (str(type), glGetShaderInfoLog(shader).decode()))
-    return shader
+    return get_backend().create_shader(type, source)
 
 
 def create_program(name: str, compiled_vertex, compiled_fragment, inputs):
@@ -289,17 +283,13 @@ class ShaderInput:
 class MeshProgram:
     def __init__(self, name: str, compiled_vertex, compiled_fragment, inputs:List[ShaderInput]=[]):
         self.name = name
-        self.program = glCreateProgram()
+        self.program, link_log = get_backend().create_program(compiled_vertex, compiled_fragment)
         self.uniforms:Dict[str, Uniform] = {}
         self.inputs:List[ShaderInput] = inputs
         self.add_uniforms_from_inputs()
 
-        glAttachShader(self.program, compiled_vertex)
-        glAttachShader(self.program, compiled_fragment)
-        glLinkProgram(self.program)
-        status = glGetProgramiv(self.program, GL_LINK_STATUS)
-        if status == GL_FALSE:
-            print("Linker failure: " + str(glGetProgramInfoLog(self.program)))
+        if link_log is not None:
+            print("Linker failure: " + link_log)
 
     def add_uniforms_from_inputs (self):
         for i in self.inputs:
@@ -318,14 +308,14 @@ class MeshProgram:
         )
 
     def update_uniform(self, name: str, values: list = None):
-        glUseProgram(self.program)
+        get_backend().use_program(self.program)
         self.check_is_uniform(name)
         self.uniforms[name].call_uniform_func(values)
 
     def init_uniforms(self):
-        glUseProgram(self.program)
+        get_backend().use_program(self.program)
         for n, u in self.uniforms.items():
-            u.loc = glGetUniformLocation(self.program, u.name)
+            u.loc = get_backend().get_uniform_location(self.program, u.name)
 
     def check_is_uniform(self, name: str) -> bool:  # not a hard stop, but warning
         if not name in self.uniforms:
@@ -357,16 +347,16 @@ class MeshProgram:
         for inp in self.inputs:
             if inp.is_texture:
                 mat_tex = mat.get_mat_texture(inp.texture_type)
-                glUniform1i(
-                    glGetUniformLocation(self.program, mat_tex.tex_type),
+                get_backend().uniform(glUniform1i, [
+                    get_backend().get_uniform_location(self.program, mat_tex.tex_type),
                     mat_tex.texture.index
-                )
+                ])
             else:
                 inp.set_value(mat.get_property(inp.name)) # unfortunately this assumes the correct type matchup. todo install type matching errors with detailed error messages
                 self.update_uniform(inp.name, inp.get_uniform_args())
 
     def use (self):
-        gl.glUseProgram(self.program)
+        get_backend().use_program(self.program)
 
 class ShaderPackage:
     """
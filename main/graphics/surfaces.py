@@ -3,6 +3,8 @@ from typing import Dict, List
 import OpenGL.GL as gl
 import pygltflib
 
+from main.graphics.backend import get_backend
+
 
 class TextureUnit:
 
@@ -21,7 +23,7 @@ class TextureUnit:
         if index == 0:
             index = TextureUnit.global_index
             TextureUnit.global_index += 1
-        return TextureUnit(index, gl.glGenTextures(1))
+        return TextureUnit(index, get_backend().gen_texture())
 
     def __init__(self, index: int, texture_unit):
         self.index = index
@@ -29,22 +31,21 @@ class TextureUnit:
 
     def bad_bind (self, target=gl.GL_TEXTURE_2D):
         self.active()
-        gl.glBindTexture(target, self.unit)
+        get_backend().bind_texture(target, self.unit)
 
     def active(self):
-        gl.glActiveTexture(gl.GL_TEXTURE0 + self.index)
+        get_backend().active_texture(self.index)
 
     def bind_tex2d(self, data, width, height, img_format, sampler: pygltflib.Sampler, type=gl.GL_UNSIGNED_BYTE):
         self.active()
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.unit)
+        get_backend().bind_texture(gl.GL_TEXTURE_2D, self.unit)
 
-        gl.glTexImage2D(
+        get_backend().tex_image_2d(
             gl.GL_TEXTURE_2D,
             0,  # level
             img_format,  # internal format
             width,
             height,
-            0,  # border (must be 0)
             img_format,  # format
             type,  # type
             data
@@ -52,12 +53,12 @@ class TextureUnit:
         self.mipmap()
         self.set_sampler(sampler)
     def mipmap (self):
-        gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+        get_backend().generate_mipmap(gl.GL_TEXTURE_2D)
     def set_sampler (self, sampler:pygltflib.Sampler):
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, sampler.magFilter)
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, sampler.minFilter)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, sampler.wrapS)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, sampler.wrapT)
+        get_backend().tex_parameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, float(sampler.magFilter))
+        get_backend().tex_parameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, float(sampler.minFilter))
+        get_backend().tex_parameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, int(sampler.wrapS))
+        get_backend().tex_parameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, int(sampler.wrapT))
 
 
 class Material:
@@ -118,6 +119,9 @@ class Material:
     def set_property (self, name, value):
         self._properties[name] = value
 
+    def get_properties (self) -> Dict[str, any]:
+        return dict(self._properties)
+
     def get_property (self, name):
         if not name in self._properties.keys():
             raise Exception(f"Shader requested property '{name}' but material '{self.name}' does not have it.")
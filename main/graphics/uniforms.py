@@ -5,6 +5,7 @@ import numpy as np
 
 # https://www.khronos.org/registry/OpenGL-Refpages/gl4/html/glUniform.xhtml
 from main.graphics import shaders
+from main.graphics.backend import get_backend
 
 u_types: Dict[str, Callable] = {
     'float': glUniform1f,
@@ -88,4 +89,4 @@ class Uniform:
         if self.values is None or len(self.values) == 0:
             print('no value set for uniform %s' % self.name)
             return
-        self.get_uniform_func()(*self.get_args())
\ No newline at end of file
+        get_backend().uniform(self.get_uniform_func(), self.get_args())
\ No newline at end of file
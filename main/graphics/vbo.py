@@ -4,23 +4,30 @@ from OpenGL.GL import *
 from array import array
 import numpy as np
 
+from main.graphics.backend import get_backend
+
 # https://github.com/TheThinMatrix/OpenGL-Tutorial-2
 # Loader.java
 class VertexBufferObject:
     def __init__(self):
-        self.handle = glGenBuffers(1)
+        self.handle = get_backend().gen_buffer()
 
     def bind(self):
-        glBindBuffer(GL_ARRAY_BUFFER, self.handle)
+        get_backend().bind_buffer(GL_ARRAY_BUFFER, self.handle)
 
     def unbind(self):
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        get_backend().bind_buffer(GL_ARRAY_BUFFER, 0)
 
     def update_data(self, data, static=True):
         self.bind()
-        glBufferData(
+        get_backend().buffer_data(
             GL_ARRAY_BUFFER,
+            data.nbytes,
             data,
             GL_STATIC_DRAW if static else GL_DYNAMIC_DRAW
         )
         self.unbind()
+
+    def delete(self):
+        get_backend().delete_buffer(self.handle)
+        self.handle = None
@@ -12,7 +12,9 @@ from main.graphics import shaders, fbos
 from main.graphics.fbos import FBO
 from main.graphics.mesh import Mesh
 from main.graphics.surfaces import MaterialTexture, TextureUnit, Material
+from main.graphics.vbo import VertexBufferObject
 import numpy as np
+from main.math import vertex_math
 from main.util import configuration
 
 GLTF = pygltflib.GLTF2()
@@ -203,7 +205,10 @@ def load_gltf(filepath, opt_input_flags:List[str]=()) -> List[Entity]:
         if index_acc is not None:
             mesh.element = True
             mesh.elementInfo = index_acc
+            mesh.index_count = index_acc.count
+            mesh.index_type = index_acc.componentType  # the gltf component types are the gl enums
             index_buff:UnboundBuffer = buffers[index_acc.bufferView]
+            mesh.indices = accessor_array(index_acc, index_buff).ravel()
             index_buff.optional_binder()(GL.GL_ELEMENT_ARRAY_BUFFER)
             mesh.elementBufID = index_buff.buffer_id
 
@@ -237,6 +242,10 @@ def load_gltf(filepath, opt_input_flags:List[str]=()) -> List[Entity]:
                 continue
             name = att.lower()
             acc = obj.accessors[val]
+            # keep a copy for baking, see lsystems.bake
+            mesh.vertex_data[name] = accessor_array(acc, buffers[acc.bufferView]).astype('float32')
+            if acc.normalized:
+                mesh.vertex_data[name] /= np.iinfo(accessor_dtype(acc.componentType)).max
             location = GL.glGetAttribLocation(mesh.gl_program, name)
             # compiler can automatically assume that a location might not exist.
             # for example, if a mesh has a texcoord_0 defined but no textures, the shader it requested will have the
@@ -264,6 +273,9 @@ def load_gltf(filepath, opt_input_flags:List[str]=()) -> List[Entity]:
                                      )
             if name == 'position': # this is ok because gltf specifies position, see attrs
                 mesh.tri_count = acc.count // 3
+        if 'normal' not in mesh.vertex_data and 'position' in mesh.vertex_data:
+            print(f'generating normals for {gltf_mesh.name}')
+            generate_normals(mesh)
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
         mesh.unbind_vao()
 
@@ -274,6 +286,24 @@ def load_gltf(filepath, opt_input_flags:List[str]=()) -> List[Entity]:
         entities.append(ent)
     return entities
 
+def generate_normals(mesh: Mesh):
+    # smooth, area weighted normals for a primitive without any, in a buffer of their own. The mesh's vao must be bound
+    positions = mesh.vertex_data['position']
+    if mesh.indices is not None:
+        normals = vertex_math.get_vertex_normals(positions, mesh.indices, area_weighted=True)
+    else:
+        normals = vertex_math.get_normals(positions.ravel()).reshape(-1, 3)
+    mesh.vertex_data['normal'] = normals
+    location = GL.glGetAttribLocation(mesh.gl_program, 'normal')
+    if location == -1:
+        return
+    mesh.normal_vbo = VertexBufferObject()
+    mesh.normal_vbo.update_data(np.ascontiguousarray(normals, dtype='float32'))
+    mesh.normal_vbo.bind()
+    GL.glEnableVertexAttribArray(location)
+    GL.glVertexAttribPointer(location, 3, GL.GL_FLOAT, GL.GL_FALSE, 12, ctypes.c_void_p(0))
+    mesh.normal_vbo.unbind()
+
 def get_default_sampler() -> pygltflib.Sampler:
     # print('created default sampler')
     sampler = pygltflib.Sampler()
@@ -348,6 +378,16 @@ gltf_samp_types: Dict[int, type] = {
     10497: GL.GL_REPEAT
 }
 
+def accessor_array(acc: pygltflib.Accessor, buff: UnboundBuffer) -> np.ndarray:
+    # a cpu copy of the data an accessor points at, as (count, components)
+    dtype = np.dtype(accessor_dtype(acc.componentType))
+    dim = accessor_type_dim(acc.type)
+    stride = buff.buffer_view.byteStride or dim * dtype.itemsize
+    data = np.ndarray((acc.count, dim), dtype=dtype, buffer=buff.data, offset=acc.byteOffset or 0,
+                      strides=(stride, dtype.itemsize))
+    return data.copy()
+
+
 def accessor_type_dim(typ: str) -> int:
     try:
         return type_to_dim[typ]
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import re
+import zipfile
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from main.graphics.mesh import Mesh
+from main.lsystems.instances import InstanceBatch
+from main.lsystems.parser import LSystem, LSystemGenerator
+from main.lsystems.rules import Production
+
+# bump whenever the derivation or the cache layout changes, so old caches are ignored
+CACHE_VERSION = 2
+
+comment_expr = re.compile(r'\s*//.*')
+# successor, then optionally '% weight' and ': condition'
+value_expr = re.compile(r'(?P<successor>\S*)(?:\s+%\s*(?P<weight>\S+))?(?:\s+:\s*(?P<condition>.+))?')
+
+
+def parse_lsystem(data_stream) -> LSystem:
+    """
+    Read an .lcr ruleset (see data/scenes/readme.md). A letter defined on several lines gets one
+    production per line, picked at random by their weights
+    """
+    ls = LSystem()
+    rules: Dict[str, List[Production]] = {}
+    for line in data_stream:
+        if comment_expr.match(line) is not None:
+            continue
+        line = line.strip()
+        if line == '':
+            continue
+        if '=' not in line:
+            raise Exception("Malformed lcr line: " + line)
+        key, value = line.split('=', 1)
+        key = key.strip()
+        if key == 'axiom':
+            ls.axiom = value.strip()
+        elif key in vars(ls) and key not in ('rules', 'resources'):
+            # a parameter
+            value = float(value)
+            setattr(ls, key, int(value) if value.is_integer() and isinstance(getattr(ls, key), int) else value)
+        else:
+            match = value_expr.fullmatch(value.strip())
+            if match is None:
+                raise Exception("Malformed lcr rule: " + line)
+            weight = float(match.group('weight')) if match.group('weight') else 1.0
+            rules.setdefault(key, []).append(Production(match.group('successor'), weight, match.group('condition')))
+    for key, productions in rules.items():
+        # plain rules stay plain strings, so the ruleset can use the deterministic fast paths
+        if len(productions) == 1 and productions[0].condition is None:
+            ls.rules[key] = productions[0].successor
+        else:
+            ls.rules[key] = productions
+    return ls
+
+
+def load_lsystem(filename: str) -> LSystem:
+    with open(filename, 'r', encoding='utf-8') as f:
+        return parse_lsystem(f)
+
+
+def content_hash(filename: str) -> str:
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return hashlib.sha1(b'%d:' % CACHE_VERSION + data).hexdigest()
+
+
+def cache_filename(filename: str) -> str:
+    return filename + '.npz'
+
+
+def load_cache(filename: str) -> Optional[Dict[str, np.ndarray]]:
+    # the cache next to an .lcr, or None if there isn't one or it's from a different version of the file
+    path = cache_filename(filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        cache = dict(np.load(path))
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+        # a truncated or corrupt cache is rebuilt like a missing one
+        return None
+    if str(cache.get('hash')) != content_hash(filename):
+        return None
+    return cache
+
+
+def write_cache(filename: str, batches: List[InstanceBatch]):
+    np.savez(cache_filename(filename),
+             hash=np.array(content_hash(filename)),
+             instance_counts=np.array([len(b) for b in batches]),
+             instances=np.concatenate([b.matrices for b in batches] + [np.empty((0, 4, 4), dtype='float32')]))
+
+
+def load_instances(filename: str, lsystem: LSystem, resources: List[Optional[Mesh]] = None) -> List[InstanceBatch]:
+    """
+    The instance batches of the L-System in an .lcr file. They're derived and interpreted once,
+    and read back from the cache next to the file for as long as the file doesn't change
+    """
+    if resources is None:
+        resources = lsystem.resources
+    cache = load_cache(filename)
+    if cache is not None:
+        batches = []
+        offset = 0
+        for i, (mesh, count) in enumerate(zip(resources, cache['instance_counts'])):
+            batch = InstanceBatch(i, mesh, capacity=int(count))
+            batch.extend(cache['instances'][offset:offset + count])
+            offset += count
+            batches.append(batch)
+        return batches
+    print('deriving %s . . .' % filename)
+    batches = LSystemGenerator(lsystem, memoize=True).generate_instances()
+    for batch, mesh in zip(batches, resources):
+        batch.mesh = mesh
+    write_cache(filename, batches)
+    return batches
@@ -1,5 +1,5 @@
 import re
-from collections import Callable
+from collections.abc import Callable
 from enum import Enum, unique
 from typing import Dict, List
 
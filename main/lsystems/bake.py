@@ -0,0 +1,147 @@
+import json
+import os
+import zipfile
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from main.core.entity import Entity
+from main.lsystems.instances import InstanceBatch
+
+# vertex attributes that get baked, see Mesh.vertex_data. Anything else a resource has is dropped
+BAKED_ATTRIBUTES = ('position', 'normal', 'texcoord_0', 'color_0')
+
+
+class BakedGeometry:
+    """
+    Every instance of the resources that share one material, pre-transformed into a single interleaved vertex array
+    and a single index array, so the whole lot is one draw call
+    """
+
+    def __init__(self, resource: int, attributes: List[Tuple[str, int]], vertices: np.ndarray, indices: np.ndarray,
+                 mesh: 'Mesh' = None):
+        self.resource = resource  # one of the resources that were baked, whose material and shader are used
+        self.mesh = mesh  # that resource's mesh, if it's known (it isn't saved with save_baked)
+        self.attributes = attributes  # (name, floats per vertex), in the order they are interleaved
+        self.vertices = vertices  # float32 (vertex count, floats per vertex)
+        self.indices = indices  # uint32
+
+    def get_stride(self) -> int:
+        return sum(dim for _, dim in self.attributes)
+
+    stride = property(get_stride)
+
+    def __str__(self) -> str:
+        return f"BakedGeometry(resource={self.resource}, vertices={len(self.vertices)}, indices={len(self.indices)})"
+
+
+def _property_key(value):
+    # material properties are numbers or (nested) lists and arrays of them
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_property_key(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def material_key(mesh: 'Mesh') -> tuple:
+    # resources with the same material, shader and attributes can share a draw call. Materials are compared by
+    # what they draw with (textures, properties and flags), their names aren't unique (e.g. gltf defaults)
+    material = mesh.material
+    textures = tuple(sorted((t.tex_type, t.texture.index, t.texture.unit) for t in material.get_all_mat_textures()))
+    properties = tuple(sorted((name, _property_key(v)) for name, v in material.get_properties().items()))
+    attributes = tuple(name for name in BAKED_ATTRIBUTES if name in mesh.vertex_data)
+    return textures, properties, tuple(sorted(material.get_flags())), mesh.branched_program, attributes
+
+
+def transform_vertices(mesh: 'Mesh', attributes: List[str], matrices: np.ndarray) -> np.ndarray:
+    # every vertex of mesh under every matrix, interleaved: (instances * vertices, floats per vertex)
+    rotations = matrices[:, :3, :3]
+    parts = []
+    for name in attributes:
+        data = mesh.vertex_data[name]
+        if name == 'position':
+            data = np.einsum('nij,vj->nvi', rotations, data) + matrices[:, np.newaxis, :3, 3]
+        elif name == 'normal':
+            # the turtle's scale is uniform, so the rotation part only needs renormalizing
+            data = np.einsum('nij,vj->nvi', rotations, data)
+            data /= np.maximum(np.linalg.norm(data, axis=2, keepdims=True), 1e-12)
+        else:
+            data = np.broadcast_to(data, (len(matrices),) + data.shape)
+        parts.append(data.astype('float32'))
+    return np.concatenate(parts, axis=2).reshape(-1, sum(p.shape[2] for p in parts))
+
+
+def bake_batches(batches: List[InstanceBatch]) -> List[BakedGeometry]:
+    """
+    Bake instance batches (see LSystemGenerator.generate_instances), one BakedGeometry per material.
+    Resource meshes have to keep their vertex data on the cpu, see gltf_loader.load_gltf
+    """
+    groups: Dict[tuple, List[InstanceBatch]] = {}
+    for batch in batches:
+        if len(batch) == 0 or batch.mesh is None or 'position' not in batch.mesh.vertex_data:
+            continue
+        groups.setdefault(material_key(batch.mesh), []).append(batch)
+
+    baked = []
+    for key, group in groups.items():
+        attributes = list(key[-1])
+        vertices, indices = [], []
+        offset = 0
+        for batch in group:
+            mesh = batch.mesh
+            count = len(mesh.vertex_data['position'])
+            mesh_indices = mesh.indices if mesh.indices is not None else np.arange(count)
+            matrices = batch.matrices.astype('float64')
+            vertices.append(transform_vertices(mesh, attributes, matrices))
+            # each instance's copy of the indices points at its own copy of the vertices
+            bases = offset + np.arange(len(matrices), dtype='uint32')[:, np.newaxis] * count
+            indices.append((bases + mesh_indices.astype('uint32')[np.newaxis]).ravel())
+            offset += count * len(matrices)
+        layout = [(name, group[0].mesh.vertex_data[name].shape[1]) for name in attributes]
+        baked.append(BakedGeometry(group[0].resource, layout, np.concatenate(vertices), np.concatenate(indices),
+                                   group[0].mesh))
+    return baked
+
+
+def bake_system(root: Entity) -> List[BakedGeometry]:
+    # bake a generate_system result, either batched or one entity per segment
+    batches: List[InstanceBatch] = []
+    meshes = {}
+    for ent in root.children:
+        if ent.instances is not None:
+            batches.append(ent.instances)
+        elif ent.mesh is not None:
+            if id(ent.mesh) not in meshes:
+                meshes[id(ent.mesh)] = InstanceBatch(len(meshes), ent.mesh)
+            meshes[id(ent.mesh)].append(ent.transform.to_model_view_matrix())
+    return bake_batches(batches + list(meshes.values()))
+
+
+def save_baked(filename: str, baked: List[BakedGeometry], key: str):
+    arrays = {'key': np.array(key), 'count': np.array(len(baked))}
+    for i, geometry in enumerate(baked):
+        arrays['resource_%d' % i] = np.array(geometry.resource)
+        arrays['attributes_%d' % i] = np.array(json.dumps(geometry.attributes))
+        arrays['vertices_%d' % i] = geometry.vertices
+        arrays['indices_%d' % i] = geometry.indices
+    np.savez(filename, **arrays)
+
+
+def load_baked(filename: str, key: str) -> Optional[List[BakedGeometry]]:
+    # the baked geometry saved with save_baked, or None if there is none or it was saved under a different key
+    if not os.path.exists(filename):
+        return None
+    try:
+        arrays = np.load(filename)
+        if str(arrays['key']) != key:
+            return None
+        return [BakedGeometry(int(arrays['resource_%d' % i]),
+                              [tuple(a) for a in json.loads(str(arrays['attributes_%d' % i]))],
+                              arrays['vertices_%d' % i], arrays['indices_%d' % i])
+                for i in range(int(arrays['count']))]
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # a truncated or corrupt file is baked again like a missing one
+        return None
@@ -0,0 +1,154 @@
+from typing import List, Iterable, Optional, Tuple
+
+import numpy as np
+
+from main.lsystems.instances import InstanceBatch
+from main.math.transform import Spatial
+
+# opcodes, see LSystem.OPCODES for which symbol compiles to which
+NOP = 0
+FORWARD = 1
+BACKWARD = 2
+ROTATE = 3  # 3-8 apply one of the six precomputed rotations, see TurtleProgram.rotations
+SCALE_UP = 9
+SCALE_DOWN = 10
+PUSH = 11
+POP = 12
+DRAW = 13
+NEXT_RESOURCE = 14
+PREV_RESOURCE = 15
+SET_RESOURCE = 16  # 16-25 set the resource to (opcode - SET_RESOURCE)
+
+
+# everything the turtle pushes and pops, as a fixed 17 float record. The matrix is the turtle's model matrix:
+# its columns are the scaled i, j and k axes and the translation, exactly what gets drawn at a '#'
+TURTLE_STATE = np.dtype([
+    ('matrix', 'f8', (4, 4)),
+    ('resource', 'f8'),
+])
+
+
+def initial_state() -> np.ndarray:
+    state = np.zeros((), dtype=TURTLE_STATE)
+    state['matrix'] = np.identity(4)
+    state['resource'] = -1
+    return state
+
+
+class TurtleStack:
+    """
+    Preallocated stack of turtle states indexed by bracket depth, so push and pop are plain row copies
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.depth = 0
+        self.states: np.ndarray = None
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity: int):
+        states = np.zeros(capacity, dtype=TURTLE_STATE)
+        if self.states is not None:
+            states[:self.depth] = self.states[:self.depth]
+        self.states = states
+        self._matrices = self.states['matrix']
+        self._resources = self.states['resource']
+
+    def push(self, matrix: np.ndarray, resource: int):
+        if self.depth == len(self.states):
+            self._allocate(len(self.states) * 2)
+        self._matrices[self.depth] = matrix
+        self._resources[self.depth] = resource
+        self.depth += 1
+
+    def pop(self) -> Tuple[np.ndarray, int]:
+        # the interpreter never modifies its matrix in place, so this can hand out a view of the row
+        if self.depth == 0:
+            raise IndexError('pop from an empty turtle stack (unbalanced "]")')
+        self.depth -= 1
+        return self._matrices[self.depth], int(self._resources[self.depth])
+
+
+def max_depth(codes: np.ndarray) -> int:
+    # deepest bracket nesting of an assembled program, enough to size a TurtleStack up front
+    if len(codes) == 0:
+        return 0
+    nesting = np.cumsum((codes == PUSH).astype('int64') - (codes == POP))
+    return max(int(nesting.max()), 0)
+
+
+def local_rotation(axis: int, radians: float) -> np.ndarray:
+    # rotation about the turtle's own i, j or k axis (0, 1, 2), applied to the turtle as matrix @ rotation
+    quat = np.zeros(4)
+    quat[axis] = np.sin(radians / 2.0)
+    quat[3] = np.cos(radians / 2.0)
+    rot = np.identity(4)
+    rot[:3, :3] = np.array([Spatial.quat_rot(quat, basis) for basis in np.identity(3)]).T
+    return rot
+
+
+class TurtleProgram:
+    """
+    The turtle actions of an LSystem compiled to opcodes
+
+    Every movement of the turtle is relative to its own axes, so each one is a right multiplication of the turtle's
+    model matrix by a constant matrix. Those are computed once here from the LSystem's parameters,
+    and the interpreter loop only does a single 4x4 matmul per symbol.
+    (the turtle's scale is always uniform, so scaling commutes with its rotations)
+    """
+
+    def __init__(self, table: np.ndarray, rotations: np.ndarray, unit_length: float, scale_multiplier: float):
+        self.table = table  # opcode for each symbol, indexed by ordinal
+        self.rotations = rotations  # 6x4x4, indexed by (opcode - ROTATE)
+        self.unit_length = unit_length
+        self.scale_multiplier = scale_multiplier
+        # indexed by opcode, identity for anything that isn't a movement
+        self.transforms = np.tile(np.identity(4), (SET_RESOURCE, 1, 1))
+        self.transforms[FORWARD][1, 3] = unit_length
+        self.transforms[BACKWARD][1, 3] = -unit_length
+        self.transforms[ROTATE:ROTATE + 6] = rotations
+        self.transforms[SCALE_UP][:3, :3] *= scale_multiplier
+        self.transforms[SCALE_DOWN][:3, :3] /= scale_multiplier
+
+    def opcode(self, ch: str) -> int:
+        o = ord(ch)
+        return int(self.table[o]) if o < len(self.table) else NOP
+
+    def assemble(self, sequence: str) -> np.ndarray:
+        # symbols that aren't turtle actions compile to NOP and are dropped
+        symbols = np.frombuffer(sequence.encode('latin-1', errors='replace'), dtype='uint8')
+        codes = self.table[symbols]
+        return codes[codes != NOP]
+
+    def run(self, codes: Iterable[int], resources: List[Optional['Mesh']], state: np.ndarray = None,
+            stack_capacity: int = 64) -> List[InstanceBatch]:
+        # if a TURTLE_STATE is given, the turtle starts from it and it is updated to where the turtle ends up
+        batches = [InstanceBatch(i, mesh) for i, mesh in enumerate(resources)]
+        resource_count = len(resources)
+        transforms = [t for t in self.transforms]
+
+        start = state
+        if state is None:
+            state = initial_state()
+        matrix = state['matrix'].copy()
+        resource = int(state['resource'])
+        stack = TurtleStack(stack_capacity)
+        for op in codes:
+            if op < PUSH:
+                matrix = matrix @ transforms[op]
+            elif op == DRAW:
+                if resource >= 0:
+                    batches[resource].append(matrix)
+            elif op == PUSH:
+                stack.push(matrix, resource)
+            elif op == POP:
+                matrix, resource = stack.pop()
+            elif op >= SET_RESOURCE:
+                resource = op - SET_RESOURCE
+            elif op == NEXT_RESOURCE:
+                resource = (resource + 1) % resource_count
+            elif op == PREV_RESOURCE:
+                resource = (resource - 1) % resource_count
+        if start is not None:
+            start['matrix'] = matrix
+            start['resource'] = resource
+        return batches
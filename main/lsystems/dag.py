@@ -0,0 +1,207 @@
+from typing import List, Optional, Dict, Tuple, Iterator
+
+import numpy as np
+
+from main import main
+from main.core.entity import Entity
+from main.graphics.mesh import InstancedMesh
+from main.lsystems import bytecode
+from main.lsystems.instances import InstanceBatch
+from main.lsystems.memo import UnbalancedChunk
+
+
+class Prototype:
+    """
+    One (symbol, depth, resource) subtree of an L-System, stored once no matter how often it appears.
+    It only holds what its own successor draws directly, every letter in it is a placement of another prototype
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.matrix: np.ndarray = np.identity(4)  # where the turtle ends up, relative to where it started
+        self.resource = -1  # the resource the turtle ends up with
+        self.instances: List[Optional[np.ndarray]] = []  # per resource, local model matrices (or None)
+        self.placements: List[Tuple['Prototype', np.ndarray]] = []  # (child, local matrix)
+        self.empty = True  # nothing is drawn by this prototype or anything under it
+
+    def __str__(self) -> str:
+        return f"Prototype({self.name}, placements={len(self.placements)})"
+
+
+class LSystemDAG:
+    """
+    The derivation of an L-System as a DAG of prototype subtrees and their placements.
+    Self-similar trees need memory for each unique subtree instead of for each segment
+    """
+
+    def __init__(self, lsystem: 'LSystem'):
+        self.lsystem = lsystem
+        self.program = lsystem.compile_actions()
+        self._transforms = [t for t in self.program.transforms]
+        self.prototypes: Dict[tuple, Prototype] = {}
+        self.root = self._build(Prototype('root'), lsystem.axiom, lsystem.iterations, -1)
+
+    def _prototype(self, symbol: str, depth: int, resource: int) -> Prototype:
+        key = (symbol, depth, resource)
+        if key not in self.prototypes:
+            name = 'p%d_%d' % (len(self.prototypes), depth)
+            self.prototypes[key] = self._build(Prototype(name), self.lsystem.get_rule(symbol), depth - 1, resource)
+        return self.prototypes[key]
+
+    def _build(self, prototype: Prototype, symbols: str, depth: int, resource: int) -> Prototype:
+        resource_count = len(self.lsystem.resources)
+        parts: List[list] = [[] for i in range(resource_count)]
+        matrix = np.identity(4)
+        stack = []
+        for ch in symbols:
+            op = self.program.opcode(ch)
+            if op == bytecode.NOP:
+                if depth > 0:
+                    child = self._prototype(ch, depth, resource)
+                    if not child.empty:
+                        prototype.placements.append((child, matrix))
+                        prototype.empty = False
+                    matrix = matrix @ child.matrix
+                    resource = child.resource
+            elif op < bytecode.PUSH:
+                matrix = matrix @ self._transforms[op]
+            elif op == bytecode.DRAW:
+                if resource >= 0:
+                    parts[resource].append(matrix)
+                    prototype.empty = False
+            elif op == bytecode.PUSH:
+                stack.append((matrix, resource))
+            elif op == bytecode.POP:
+                if len(stack) == 0:
+                    raise UnbalancedChunk(symbols)
+                matrix, resource = stack.pop()
+            elif op >= bytecode.SET_RESOURCE:
+                resource = op - bytecode.SET_RESOURCE
+            elif op == bytecode.NEXT_RESOURCE:
+                resource = (resource + 1) % resource_count
+            elif op == bytecode.PREV_RESOURCE:
+                resource = (resource - 1) % resource_count
+        if len(stack) > 0:
+            raise UnbalancedChunk(symbols)
+        prototype.matrix = matrix
+        prototype.resource = resource
+        prototype.instances = [np.array(p) if len(p) > 0 else None for p in parts]
+        return prototype
+
+    def ordered_prototypes(self) -> List[Prototype]:
+        # every prototype comes after all of the prototypes that place it
+        order: List[Prototype] = []
+        visited = set()
+
+        def visit(p: Prototype):
+            if id(p) in visited:
+                return
+            visited.add(id(p))
+            for child, _ in p.placements:
+                visit(child)
+            order.append(p)
+
+        visit(self.root)
+        order.reverse()
+        return order
+
+    def placements(self, root_matrix: np.ndarray = None) -> Dict[int, np.ndarray]:
+        # world matrices of every placement of each prototype (keyed by id), one batched matmul per edge
+        if root_matrix is None:
+            root_matrix = np.identity(4)
+        world: Dict[int, list] = {id(self.root): [root_matrix[np.newaxis]]}
+        for p in self.ordered_prototypes():
+            mats = np.concatenate(world[id(p)])
+            world[id(p)] = mats
+            for child, local in p.placements:
+                world.setdefault(id(child), []).append(np.matmul(mats, local))
+        return world
+
+    def walk(self, root_matrix: np.ndarray = None) -> Iterator[Tuple[Prototype, np.ndarray]]:
+        # every placement of every prototype with its world matrix, depth first. Unlike placements this only ever
+        # holds the path to the current placement (and the siblings still to visit along it)
+        if root_matrix is None:
+            root_matrix = np.identity(4)
+        stack = [(self.root, root_matrix)]
+        while stack:
+            prototype, world = stack.pop()
+            yield prototype, world
+            for child, local in reversed(prototype.placements):
+                stack.append((child, world @ local))
+
+    def flatten(self) -> List[InstanceBatch]:
+        # every instance in world space, the same as the flat interpreters produce (although ordered differently)
+        batches = [InstanceBatch(i, mesh) for i, mesh in enumerate(self.lsystem.resources)]
+        world = self.placements()
+        for p in self.ordered_prototypes():
+            for r, local in enumerate(p.instances):
+                if local is not None:
+                    batches[r].extend(np.matmul(world[id(p)][:, np.newaxis], local[np.newaxis]).reshape(-1, 4, 4))
+        return batches
+
+    def nbytes(self) -> int:
+        total = 0
+        for p in [self.root] + list(self.prototypes.values()):
+            total += sum(i.nbytes for i in p.instances if i is not None) + len(p.placements) * 16 * 8
+        return total
+
+
+class DAGEntity(Entity):
+    """
+    Scene node for an LSystemDAG. The DAG is never flattened: every frame it's walked depth first (see
+    LSystemDAG.walk) and the local instances of each prototype are drawn where it's placed, so besides the DAG only
+    one path through it and a chunk of model matrices per resource are held. Instanced, the DAG is flattened once
+    into one instance buffer per resource instead, for one draw per resource. That needs memory for every segment,
+    like any instanced tree
+    """
+    CHUNK = 1024  # model matrices collected per resource before they're drawn
+
+    def __init__(self, name: str, dag: LSystemDAG, instanced: bool = False):
+        Entity.__init__(self, name)
+        self.dag = dag
+        self.instanced = instanced
+        self._instanced: List[Tuple[InstancedMesh, InstanceBatch]] = None
+
+    def get_instanced(self) -> List[Tuple[InstancedMesh, InstanceBatch]]:
+        if self._instanced is None:
+            self._instanced = []
+            for batch in self.dag.flatten():
+                if len(batch) == 0 or batch.mesh is None:
+                    continue
+                mesh = InstancedMesh(batch.mesh)
+                mesh.update_instances(batch)
+                self._instanced.append((mesh, batch))
+        return self._instanced
+
+    def render(self):
+        if main.exceeded_max_render_time():
+            return
+        if self.instanced:
+            for mesh, batch in self.get_instanced():
+                mesh.render_instances(self.transform, batch)
+        else:
+            self.render_walk()
+        Entity.render(self)
+
+    def render_walk(self):
+        resources = self.dag.lsystem.resources
+        chunks = [np.empty((DAGEntity.CHUNK, 4, 4), dtype='float32') for _ in resources]
+        filled = [0] * len(resources)
+        for prototype, world in self.dag.walk(self.transform.to_model_view_matrix_global()):
+            if main.exceeded_max_render_time():
+                return
+            for r, local in enumerate(prototype.instances):
+                if local is None or resources[r] is None:
+                    continue
+                placed = np.matmul(world, local)
+                while len(placed) > 0:
+                    count = min(DAGEntity.CHUNK - filled[r], len(placed))
+                    chunks[r][filled[r]:filled[r] + count] = placed[:count]
+                    filled[r] += count
+                    placed = placed[count:]
+                    if filled[r] == DAGEntity.CHUNK:
+                        resources[r].render_matrices(chunks[r])
+                        filled[r] = 0
+        for r, count in enumerate(filled):
+            if count > 0:
+                resources[r].render_matrices(chunks[r][:count])
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class InstanceBatch:
+    """
+    Model matrices of every instance of one L-System resource, stored in a single growable float32 buffer
+    """
+
+    def __init__(self, resource: int, mesh: 'Mesh' = None, capacity: int = 64):
+        self.resource = resource
+        self.mesh = mesh
+        self.count = 0
+        self.version = 0  # bumped on every change, so uploaded copies know when they are stale
+        self._buffer = np.empty((max(capacity, 1), 4, 4), dtype='float32')
+
+    def _reserve(self, count: int):
+        if count <= len(self._buffer):
+            return
+        capacity = len(self._buffer)
+        while capacity < count:
+            capacity *= 2
+        buffer = np.empty((capacity, 4, 4), dtype='float32')
+        buffer[:self.count] = self._buffer[:self.count]
+        self._buffer = buffer
+
+    def append(self, matrix: np.ndarray):
+        self._reserve(self.count + 1)
+        self._buffer[self.count] = matrix
+        self.count += 1
+        self.version += 1
+
+    def extend(self, matrices: np.ndarray):
+        self._reserve(self.count + len(matrices))
+        self._buffer[self.count:self.count + len(matrices)] = matrices
+        self.count += len(matrices)
+        self.version += 1
+
+    def get_scales(self) -> np.ndarray:
+        # the turtle's scale at each instance, it's always uniform so the length of any axis
+        return np.linalg.norm(self.matrices[:, :3, 0], axis=1)
+
+    def select(self, mask: np.ndarray) -> 'InstanceBatch':
+        # a copy with only the instances where mask is set
+        kept = self.matrices[mask]
+        batch = InstanceBatch(self.resource, self.mesh, capacity=len(kept))
+        batch.extend(kept)
+        return batch
+
+    def get_matrices(self) -> np.ndarray:
+        return self._buffer[:self.count]
+
+    matrices = property(get_matrices)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __str__(self) -> str:
+        return f"InstanceBatch(resource={self.resource}, count={self.count})"
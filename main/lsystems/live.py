@@ -0,0 +1,184 @@
+import threading
+from typing import List, Optional, Callable
+
+from main.core import console
+from main.core.console import CVar, CCmd, conprint
+from main.core.entity import Entity
+from main.graphics.mesh import Mesh, InstancedMesh
+from main.lsystems.instances import InstanceBatch
+from main.lsystems.parser import LSystem, LSystemGenerator
+
+# the L-System the ls_ console commands change, see track
+LIVE: 'LiveLSystem' = None
+# cvar -> the LSystem field it sets
+CVAR_FIELDS = {
+    'ls_iterations': 'iterations',
+    'ls_pitch': 'pitch_angle',
+    'ls_spin': 'spin_angle',
+    'ls_binormal': 'binormal_angle',
+    'ls_scale': 'scale_multiplier',
+}
+
+
+class LiveLSystem:
+    """
+    An L-System in the scene that can be changed while it's shown. Changes are queued and applied on a worker thread,
+    which rebuilds the instances with LSystemGenerator.update. The main thread picks the result up with swap
+    between frames, so the render loop never waits on a rebuild and no gl calls happen off the main thread
+    """
+
+    def __init__(self, lsystem: LSystem, resources: List[Optional[Mesh]], root: Entity, instanced: bool = False):
+        self.lsystem = lsystem  # only ever touched by the worker once it's tracked
+        self.lsystem.resources = resources
+        self.root = root
+        self.instanced = instanced
+        self.generator: LSystemGenerator = None
+        self._edits: List[Callable[[LSystem], None]] = []
+        self._ready: List[InstanceBatch] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='lsystem-rebuild', daemon=True)
+        self._worker.start()
+
+    def edit(self, change: Callable[[LSystem], None]):
+        # queue a change to the L-System, edits queued during a rebuild are applied together after it
+        with self._lock:
+            self._edits.append(change)
+            # under the lock, so the worker can't take this edit and then see a stale wake up for it
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                edits, self._edits = self._edits, []
+                self._wake.clear()
+            if len(edits) == 0:
+                continue
+            for change in edits:
+                change(self.lsystem)
+            try:
+                if self.generator is None:
+                    self.generator = LSystemGenerator(self.lsystem, memoize=True)
+                previous = self.generator.instances
+                batches = self.generator.update()
+            except Exception as e:
+                conprint('L-System rebuild failed: %s' % e, (1, 0.25, 0.25))
+                continue
+            # update hands back the same batches if the edits didn't change anything
+            if batches is previous:
+                continue
+            with self._lock:
+                self._ready = batches
+
+    def swap(self) -> bool:
+        # call between frames, puts the latest finished rebuild in the scene. Returns whether there was one
+        with self._lock:
+            batches, self._ready = self._ready, None
+        if batches is None:
+            return False
+        # the resources that are still drawn keep their entity and mesh, only the instances are replaced
+        entities = {ent.instances.resource: ent for ent in self.root.children if ent.instances is not None}
+        children = [ent for ent in self.root.children if ent.instances is None]
+        for batch in batches:
+            if len(batch) == 0 or batch.mesh is None:
+                continue
+            ent = entities.pop(batch.resource, None)
+            if ent is None:
+                ent = Entity('l-system-%d' % batch.resource)
+                ent.mesh = InstancedMesh(batch.mesh) if self.instanced else batch.mesh
+                ent.parent = self.root
+            elif self.instanced and not isinstance(ent.mesh, InstancedMesh):
+                # the first swap takes over the tree the L-System was loaded into
+                ent.mesh = InstancedMesh(ent.mesh)
+            ent.instances = batch
+            if isinstance(ent.mesh, InstancedMesh):
+                ent.mesh.update_instances(batch)
+            children.append(ent)
+        # resources that aren't drawn any more
+        for ent in entities.values():
+            if isinstance(ent.mesh, InstancedMesh):
+                ent.mesh.instance_vbo.delete()
+            ent.parent = None
+        self.root.children = children
+        return True
+
+
+def track(lsystem: LSystem, resources: List[Optional[Mesh]], root: Entity, instanced: bool = False) -> LiveLSystem:
+    # make root's L-System the one the console commands change
+    global LIVE
+    for cvar, field in CVAR_FIELDS.items():
+        console.cvars[cvar]['value'] = getattr(lsystem, field)
+    LIVE = LiveLSystem(lsystem, resources, root, instanced)
+    return LIVE
+
+
+def swap() -> bool:
+    return LIVE is not None and LIVE.swap()
+
+
+def _set_field(name: str, value):
+    if LIVE is None:
+        conprint('No L-System to change')
+        return
+
+    def change(lsystem: LSystem):
+        setattr(lsystem, name, value)
+
+    LIVE.edit(change)
+
+
+@CVar("ls_iterations", flags=0, default_value=5)
+def _ls_iterations(value):
+    _set_field('iterations', int(value))
+    return int(value)
+
+
+@CVar("ls_pitch", flags=0, default_value=22.5)
+def _ls_pitch(value):
+    _set_field('pitch_angle', float(value))
+    return float(value)
+
+
+@CVar("ls_spin", flags=0, default_value=22.5)
+def _ls_spin(value):
+    _set_field('spin_angle', float(value))
+    return float(value)
+
+
+@CVar("ls_binormal", flags=0, default_value=22.5)
+def _ls_binormal(value):
+    _set_field('binormal_angle', float(value))
+    return float(value)
+
+
+@CVar("ls_scale", flags=0, default_value=1.2)
+def _ls_scale(value):
+    _set_field('scale_multiplier', float(value))
+    return float(value)
+
+
+@CCmd("ls_rule")
+def _ls_rule(*args):
+    if len(args) != 2:
+        conprint("Usage: /ls_rule <letter> <successor>")
+        return
+    if LIVE is None:
+        conprint('No L-System to change')
+        return
+    letter, successor = args
+
+    def change(lsystem: LSystem):
+        lsystem.rules = {**lsystem.rules, letter: successor}
+
+    LIVE.edit(change)
+
+
+@CCmd("ls_rules")
+def _ls_rules(*args):
+    if LIVE is None:
+        conprint('No L-System to change')
+        return
+    # only read here, a rebuild never changes the rules dict in place
+    for letter, successor in LIVE.lsystem.rules.items():
+        conprint('%s=%s' % (letter, successor))
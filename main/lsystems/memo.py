@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import List, Optional, Hashable, Callable, Set
+
+import numpy as np
+
+from main.lsystems import bytecode
+from main.lsystems.bytecode import TurtleProgram
+from main.lsystems.instances import InstanceBatch
+
+
+class LRUCache:
+    """
+    Dictionary that forgets its least recently used entries once their total size passes max_bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size)
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value, size: int):
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        # forget every entry whose key matches
+        for key in [k for k in self._entries.keys() if predicate(k)]:
+            _, size = self._entries.pop(key)
+            self.nbytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Chunk:
+    """
+    The interpreted geometry of one (symbol, depth) expansion, relative to the turtle state it starts from.
+    Since every turtle movement is a right multiplication of the turtle's matrix, placing the chunk somewhere
+    is just a multiplication of its instances by the turtle matrix there
+    """
+    __slots__ = ('matrix', 'resource', 'instances', 'nbytes')
+
+    def __init__(self, matrix: np.ndarray, resource: int, instances: List[Optional[np.ndarray]]):
+        self.matrix = matrix  # where the turtle ends up, relative to where it started
+        self.resource = resource  # the resource the turtle ends up with
+        self.instances = instances  # per resource, local model matrices (or None)
+        self.nbytes = matrix.nbytes + sum(i.nbytes for i in instances if i is not None)
+
+
+class UnbalancedChunk(Exception):
+    # an expansion pops more than it pushes (or the other way around), so it can't be placed by a single matrix
+    pass
+
+
+class SubtreeCache:
+    """
+    Memoizes L-System expansions by (symbol, remaining depth). A symbol always expands to the same string
+    at the same depth, so each expansion is derived (and interpreted) once and then shared wherever it appears
+    """
+
+    def __init__(self, lsystem: 'LSystem', max_bytes: int = 256 * 1024 * 1024):
+        self.lsystem = lsystem
+        self.program: TurtleProgram = lsystem.compile_actions()
+        self._transforms = [t for t in self.program.transforms]
+        # half for strings, half for geometry
+        self.expansions = LRUCache(max_bytes // 2)
+        self.chunks = LRUCache(max_bytes // 2)
+
+    def clear(self):
+        self.clear_geometry()
+        self.expansions.clear()
+
+    def clear_geometry(self):
+        # for when only the turtle's parameters changed, the expansions are still good
+        self.program = self.lsystem.compile_actions()
+        self._transforms = [t for t in self.program.transforms]
+        self.chunks.clear()
+
+    def invalidate(self, symbols: Set[str]):
+        # for when the rules of some letters changed, see LSystem.affected_letters
+        self.expansions.discard(lambda key: key[0] in symbols)
+        self.chunks.discard(lambda key: key[0] in symbols)
+
+    def _expands(self, ch: str, depth: int) -> bool:
+        # letters expand, turtle actions and resources are their own expansion
+        return depth > 0 and self.program.opcode(ch) == bytecode.NOP
+
+    def expand(self, symbol: str, depth: int) -> str:
+        if not self._expands(symbol, depth):
+            return symbol
+        key = (symbol, depth)
+        expansion = self.expansions.get(key)
+        if expansion is None:
+            expansion = ''.join([self.expand(ch, depth - 1) for ch in self.lsystem.get_rule(symbol)])
+            self.expansions.put(key, expansion, len(expansion))
+        return expansion
+
+    def expand_sequence(self, sequence: str, depth: int) -> str:
+        return ''.join([self.expand(ch, depth) for ch in sequence])
+
+    def chunk(self, symbol: str, depth: int, resource: int) -> Chunk:
+        # the geometry of expand(symbol, depth), for a turtle starting at the origin with the given resource
+        key = (symbol, depth, resource)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.interpret(self.lsystem.get_rule(symbol), depth - 1, resource)
+            self.chunks.put(key, chunk, chunk.nbytes)
+        return chunk
+
+    def interpret(self, symbols: str, depth: int, resource: int) -> Chunk:
+        # interpret symbols whose letters still expand depth more times
+        resource_count = len(self.lsystem.resources)
+        transforms = self._transforms
+        parts: List[list] = [[] for i in range(resource_count)]
+        matrix = np.identity(4)
+        stack = []
+        for ch in symbols:
+            op = self.program.opcode(ch)
+            if op == bytecode.NOP:
+                if self._expands(ch, depth):
+                    child = self.chunk(ch, depth, resource)
+                    for r, local in enumerate(child.instances):
+                        if local is not None:
+                            parts[r].append(np.matmul(matrix, local))
+                    matrix = matrix @ child.matrix
+                    resource = child.resource
+            elif op < bytecode.PUSH:
+                matrix = matrix @ transforms[op]
+            elif op == bytecode.DRAW:
+                if resource >= 0:
+                    parts[resource].append(matrix[np.newaxis])
+            elif op == bytecode.PUSH:
+                stack.append((matrix, resource))
+            elif op == bytecode.POP:
+                if len(stack) == 0:
+                    raise UnbalancedChunk(symbols)
+                matrix, resource = stack.pop()
+            elif op >= bytecode.SET_RESOURCE:
+                resource = op - bytecode.SET_RESOURCE
+            elif op == bytecode.NEXT_RESOURCE:
+                resource = (resource + 1) % resource_count
+            elif op == bytecode.PREV_RESOURCE:
+                resource = (resource - 1) % resource_count
+        if len(stack) > 0:
+            raise UnbalancedChunk(symbols)
+        instances = [np.concatenate(p) if len(p) > 0 else None for p in parts]
+        return Chunk(matrix, resource, instances)
+
+    def generate_instances(self) -> List[InstanceBatch]:
+        top = self.interpret(self.lsystem.axiom, self.lsystem.iterations, -1)
+        batches = []
+        for i, mesh in enumerate(self.lsystem.resources):
+            local = top.instances[i]
+            batch = InstanceBatch(i, mesh, capacity=len(local) if local is not None else 1)
+            if local is not None:
+                batch.extend(local)
+            batches.append(batch)
+        return batches
@@ -1,14 +1,140 @@
+from typing import List, Optional
+
 from main.core.entity import Entity
+from main.core.lod import LODEntity
 from main.core.scene import Scene
+from main.graphics.mesh import InstancedMesh, Mesh, BakedMesh
+from main.loader import lcr_loader
+from main.lsystems import parallel, bake, tubes
+from main.lsystems.dag import DAGEntity
+from main.lsystems.instances import InstanceBatch
 from main.lsystems.parser import LSystem, LSystemGenerator
 import numpy as np
 
-def create_lsystem (lsystem:LSystem) -> Entity:
-    generator = LSystemGenerator(lsystem)
+# fraction of the instances kept at each level of detail, biggest first, see lod_system
+LOD_FRACTIONS = (1.0, 0.4, 0.1)
+# how many tree radii away from the camera each level after the first starts
+LOD_STEP = 4.0
+
+
+def lod_system (batches:List[InstanceBatch], instanced=False, fractions=LOD_FRACTIONS, step=LOD_STEP) -> LODEntity:
+    # the same tree at several levels of detail, each dropping the smallest segments (twigs and leaves first)
+    counts = [len(b) for b in batches]
+    scales = np.concatenate([b.get_scales() for b in batches] + [np.zeros(0)])
+    translations = np.concatenate([b.matrices[:, :3, 3] for b in batches] + [np.zeros((1, 3))])
+    radius = max(float(np.linalg.norm(translations, axis=1).max()), 1.0)
+    # rank every instance by scale, many share the same one so ties are broken by a fixed shuffle
+    shuffle = np.random.default_rng(0).permutation(len(scales))
+    rank = np.empty(len(scales), dtype='int64')
+    rank[np.lexsort((shuffle, -scales))] = np.arange(len(scales))
+    levels = []
+    for fraction in fractions:
+        kept = np.split(rank < int(np.ceil(len(scales) * fraction)), np.cumsum(counts)[:-1])
+        tree = LSystemGenerator.batched_system([b.select(k) for b, k in zip(batches, kept)])
+        if instanced:
+            for ent in tree.children:
+                ent.mesh = InstancedMesh(ent.mesh)
+        levels.append(tree)
+    return LODEntity('l-system-lod', levels, [i * radius * step for i in range(len(levels))])
+
+
+def baked_system (baked:List[bake.BakedGeometry], resources:List[Optional[Mesh]]) -> Entity:
+    # one node per material, each a single draw call
+    root = Entity('l-system-root')
+    for geometry in baked:
+        mesh = geometry.mesh if geometry.mesh is not None else resources[geometry.resource]
+        ent = Entity('l-system-baked-%d' % geometry.resource)
+        ent.mesh = BakedMesh(mesh, geometry)
+        ent.parent = root
+        root.children.append(ent)
+    return root
+
+
+def tube_system (batches:List[InstanceBatch], tube_resources:List[int], unit_length:float, instanced=False) -> Entity:
+    # the tube_resources swept into one continuous tube mesh instead of stamped, everything else batched as usual
+    tree = LSystemGenerator.batched_system([b for b in batches if b.resource not in tube_resources])
+    if instanced:
+        for ent in tree.children:
+            ent.mesh = InstancedMesh(ent.mesh)
+    geometry = tubes.tube_geometry(batches, tube_resources, unit_length)
+    if len(geometry.indices) > 0 and geometry.mesh is not None:
+        ent = Entity('l-system-tubes')
+        ent.mesh = BakedMesh(geometry.mesh, geometry)
+        ent.parent = tree
+        tree.children.append(ent)
+    return tree
+
+
+def create_lsystem (lsystem:LSystem, batched=False, instanced=False, dag=False, lod=False, baked=False,
+                    tube_resources:List[int]=None) -> Entity:
+    """
+    The L-System as a scene node, laid out in at most one of these ways (the default is one entity per segment):
+    batched (one node per resource), dag (one copy of each unique subtree), lod (levels of detail), baked
+    (one mesh per material) or tube_resources (those resources swept into tubes, the rest batched).
+    instanced draws the instances of each resource with one draw call, with anything but baked.
+    Raises ValueError for options that don't go together
+    """
+    layouts = [name for name, used in (('batched', batched), ('dag', dag), ('lod', lod), ('baked', baked),
+                                       ('tube_resources', tube_resources is not None)) if used]
+    if len(layouts) > 1:
+        raise ValueError('L-System layouts %s can\'t be combined' % ' and '.join(layouts))
+    if baked and instanced:
+        raise ValueError('baked L-Systems are already a single draw per material, they can\'t be instanced')
+    if tube_resources is not None:
+        # e.g. the branches, see the resource setup in main.py
+        batches = LSystemGenerator(lsystem, memoize=True).generate_instances()
+        return tube_system(batches, tube_resources, lsystem.unit_length, instanced)
+    if baked:
+        return baked_system(bake.bake_batches(LSystemGenerator(lsystem, memoize=True).generate_instances()),
+                            lsystem.resources)
+    if lod:
+        return lod_system(LSystemGenerator(lsystem, memoize=True).generate_instances(), instanced)
+    generator = LSystemGenerator(lsystem, lazy=dag)  # the dag never needs the sequence
     # generator.turtle.spatial.align_j(np.array([0.0, 1.0, 0.0]))
-    tree = generator.generate_system()
+    tree = generator.generate_system(batched or instanced, dag)
+    if isinstance(tree, DAGEntity):
+        tree.instanced = instanced
+    elif instanced:
+        # one instanced draw per resource instead of one draw per segment
+        for ent in tree.children:
+            ent.mesh = InstancedMesh(ent.mesh)
     # sc = tree.transform.get_scale()
     # tree.transform.set_scale(np.array([sc[0], sc[1], sc[2]]))
     # tree.transform.set_translation(np.array([0.0, 1.0, 0.0]))
     # tree.transform.set_rotation(np.array([0.707, 0.0, 0.0, 0.707]))
-    return tree
\ No newline at end of file
+    return tree
+
+
+def create_lsystems (lsystems:List[LSystem], instanced=True, max_workers=None, lod=False) -> List[Entity]:
+    # generate a whole forest in parallel, only the gl side happens here
+    trees = []
+    for batches in parallel.generate_forest(lsystems, max_workers):
+        if lod:
+            trees.append(lod_system(batches, instanced))
+            continue
+        tree = LSystemGenerator.batched_system(batches)
+        if instanced:
+            for ent in tree.children:
+                ent.mesh = InstancedMesh(ent.mesh)
+        trees.append(tree)
+    return trees
+
+
+def load_lsystem (filename:str, resources:List[Optional[Mesh]], instanced=False, baked=False) -> Entity:
+    # an .lcr ruleset, only derived (and baked) if it changed since the last time it was loaded
+    lsystem = lcr_loader.load_lsystem(filename)
+    if baked:
+        # the resources go into the baked vertices too, so their sizes are part of the key
+        sizes = [(len(m.vertex_data.get('position', ())), len(m.indices) if m.indices is not None else 0)
+                 if m is not None else None for m in resources]
+        key = '%s:%s' % (lcr_loader.content_hash(filename), sizes)
+        geometry = bake.load_baked(filename + '.baked.npz', key)
+        if geometry is None:
+            geometry = bake.bake_batches(lcr_loader.load_instances(filename, lsystem, resources))
+            bake.save_baked(filename + '.baked.npz', geometry, key)
+        return baked_system(geometry, resources)
+    tree = LSystemGenerator.batched_system(lcr_loader.load_instances(filename, lsystem, resources))
+    if instanced:
+        for ent in tree.children:
+            ent.mesh = InstancedMesh(ent.mesh)
+    return tree
@@ -1,6 +1,9 @@
+import numpy as np
+
 from main.core.entity import Entity
+from main.lsystems.dag import DAGEntity, LSystemDAG
 from main.lsystems.parser import LSystem, LSystemGenerator
-from main.math import vertex_math
+from main.math import vertex_math, quaternion
 
 
 def disp_arr (narray, precision=5):
@@ -18,7 +21,14 @@ module s (start, end, thickness_start, thickness_end) {
     """
     precision = 3
     tree:Entity = entity
+    if isinstance(tree, DAGEntity):
+        script += generate_OpenSCAD_modules(tree.dag, precision)
     for t in tree.children:
+        if t.instances is not None:
+            # a batched node, one segment per instance
+            for m in t.instances.matrices:
+                script += "\n" + matrix_segment(m, precision)
+            continue
         p1 = t.transform.get_translation()
         p2 = p1 + vertex_math.norm_vec3(t.transform.get_rotation()[0:3]) * t.transform.get_scale()[1]
         thickness = t.transform.get_scale()[0] * 0.4
@@ -30,4 +40,41 @@ module s (start, end, thickness_start, thickness_end) {
     f = open(output_file, 'w')
     f.write(script)
     f.close()
-    return True
\ No newline at end of file
+    return True
+
+
+def matrix_segment (m, precision=3):
+    # the segment for a turtle model matrix, exactly what an entity with that transform gets above
+    p1 = m[:3, 3]
+    scale = np.linalg.norm(m[:3, :3], axis=0)
+    p2 = p1 + vertex_math.norm_vec3(quaternion.from_matrix(m)[:3]) * scale[1]
+    thickness = scale[0] * 0.4
+    return "s(%s, %s, %.3f, %.3f);"%(disp_arr(p1, precision), disp_arr(p2, precision), thickness, thickness)
+
+
+def heading_segment (m, precision=3):
+    # the segment from a turtle model matrix's origin one unit along its j axis. Unlike matrix_segment this stays
+    # right when placed with multmatrix, which doesn't carry a rotation's axis along with it
+    p1 = m[:3, 3]
+    p2 = (m @ np.array([0.0, 1.0, 0.0, 1.0]))[:3]
+    thickness = np.linalg.norm(m[:3, 0]) * 0.4
+    return "s(%s, %s, %.3f, %.3f);"%(disp_arr(p1, precision), disp_arr(p2, precision), thickness, thickness)
+
+
+def generate_OpenSCAD_modules (dag:LSystemDAG, precision=3):
+    # one module per prototype, so every repeated subtree is written out once and placed with multmatrix.
+    # The segments go along the turtle's heading (heading_segment), so they aren't the same as the flat script's
+    script = ''
+    for p in reversed(dag.ordered_prototypes()):
+        script += "\nmodule %s () {" % p.name
+        for local in p.instances:
+            if local is None:
+                continue
+            for m in local:
+                script += "\n    " + heading_segment(m, precision)
+        for child, local in p.placements:
+            rows = ','.join([disp_arr(row, precision) for row in local])
+            script += "\n    multmatrix([%s]) %s();" % (rows, child.name)
+        script += "\n}\n"
+    script += "\n%s();" % dag.root.name
+    return script
@@ -0,0 +1,187 @@
+import importlib
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from main.graphics.mesh import Mesh
+from main.lsystems import bytecode
+from main.lsystems.bytecode import TurtleProgram
+from main.lsystems.instances import InstanceBatch
+from main.lsystems.parser import LSystem, LSystemGenerator
+
+# (shared memory block name, instance count) per resource slot, or None for a slot with no instances
+SharedBatches = List[Optional[Tuple[str, int]]]
+
+
+def share_batches(batches: List[InstanceBatch]) -> SharedBatches:
+    # copy each batch into its own shared memory block so it doesn't have to be pickled back to the parent
+    shared = []
+    try:
+        for batch in batches:
+            if len(batch) == 0:
+                shared.append(None)
+                continue
+            matrices = batch.matrices
+            shm = shared_memory.SharedMemory(create=True, size=matrices.nbytes)
+            shared.append((shm.name, len(batch)))
+            # the parent owns the block from here on and unlinks it once it has been read,
+            # so this process' resource tracker must not clean it up when the worker exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            np.ndarray(matrices.shape, dtype=matrices.dtype, buffer=shm.buf)[:] = matrices
+            shm.close()
+    except BaseException:
+        release_batches(shared)
+        raise
+    return shared
+
+
+def release_batches(shared: SharedBatches):
+    # unlink blocks that are never going to be collected
+    for entry in shared:
+        if entry is None:
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=entry[0])
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def discard_pending(futures: List[Future]):
+    # after a failed job: the other jobs' blocks would leak, since nothing collects them any more
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        if future.cancelled():
+            continue
+        try:
+            shared = future.result()
+        except Exception:
+            continue
+        release_batches(shared)
+
+
+def create_pool(max_workers: int = None, mp_context=None) -> ProcessPoolExecutor:
+    # with the spawn start method (windows, macos) workers import this module from scratch, which only works
+    # with main.main imported first, same as run.py does
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                               initializer=importlib.import_module, initargs=('main.main',))
+
+
+def collect_batches(shared: SharedBatches, resources: List[Optional[Mesh]]) -> List[InstanceBatch]:
+    batches = []
+    for resource, (mesh, entry) in enumerate(zip(resources, shared)):
+        batch = InstanceBatch(resource, mesh, capacity=entry[1] if entry is not None else 1)
+        if entry is not None:
+            shm = shared_memory.SharedMemory(name=entry[0])
+            batch.extend(np.ndarray((entry[1], 4, 4), dtype='float32', buffer=shm.buf))
+            shm.close()
+            shm.unlink()
+        batches.append(batch)
+    return batches
+
+
+def _generate_shared(lsystem: LSystem) -> SharedBatches:
+    # runs in a worker process
+    generator = LSystemGenerator(lsystem)
+    return share_batches(generator.generate_instances())
+
+
+def generate_forest(lsystems: List[LSystem], max_workers: int = None, mp_context=None) -> List[List[InstanceBatch]]:
+    """
+    Derive and interpret many L-Systems at once across a process pool.
+    Returns the instance batches of each L-System, in the same order. No gl calls are made here,
+    so uploading the results stays on the main thread
+    """
+    definitions = [ls.without_resources() for ls in lsystems]
+    with create_pool(max_workers, mp_context) as pool:
+        futures = [pool.submit(_generate_shared, definition) for definition in definitions]
+        forest = []
+        for i, (future, ls) in enumerate(zip(futures, lsystems)):
+            try:
+                shared = future.result()
+            except BaseException:
+                discard_pending(futures[i + 1:])
+                raise
+            forest.append(collect_batches(shared, ls.resources))
+        return forest
+
+
+def _run_shared(program: TurtleProgram, codes: np.ndarray, state: np.ndarray, resource_count: int) -> SharedBatches:
+    # runs in a worker process
+    batches = program.run(codes.tolist(), [None] * resource_count, state, bytecode.max_depth(codes))
+    return share_batches(batches)
+
+
+def _split(program: TurtleProgram, codes: np.ndarray, state: np.ndarray, resource_count: int,
+           pool: ProcessPoolExecutor, chunk_size: int, pieces: list):
+    """
+    Walk one level of codes (a whole program or the inside of a branch). Everything outside of its top-level
+    brackets is run right here to find the turtle state at each '[', and every branch is either sent to the pool
+    with that state or, if it's still too big, split the same way. The pieces are appended in sequence order
+    """
+    nesting = np.cumsum((codes == bytecode.PUSH).astype('int64') - (codes == bytecode.POP))
+    opens = np.flatnonzero((codes == bytecode.PUSH) & (nesting == 1))
+    closes = np.flatnonzero((codes == bytecode.POP) & (nesting == 0))
+    position = 0
+    for start, end in zip(opens, closes):
+        # a branch always leaves the turtle where it found it, so only the trunk moves the state along
+        pieces.append(program.run(codes[position:start].tolist(), [None] * resource_count, state))
+        branch = codes[start + 1:end]
+        if len(branch) > chunk_size:
+            _split(program, branch, state.copy(), resource_count, pool, chunk_size, pieces)
+        else:
+            pieces.append(pool.submit(_run_shared, program, branch, state.copy(), resource_count))
+        position = end + 1
+    pieces.append(program.run(codes[position:].tolist(), [None] * resource_count, state))
+
+
+def _balance(codes: np.ndarray) -> np.ndarray:
+    # a '[' that is never closed leaves the turtle where it is for the rest of the program, so dropping it changes
+    # nothing and every branch left has an end to split at. A ']' with nothing to pop fails like it does in
+    # TurtleProgram.run
+    nesting = np.cumsum((codes == bytecode.PUSH).astype('int64') - (codes == bytecode.POP))
+    if len(codes) == 0:
+        return codes
+    if nesting.min() < 0:
+        raise IndexError('pop from an empty turtle stack (unbalanced "]")')
+    # an open bracket is closed if the nesting drops below its level somewhere after it
+    lowest_after = np.minimum.accumulate(nesting[::-1])[::-1]
+    return codes[~((codes == bytecode.PUSH) & (lowest_after >= nesting))]
+
+
+def generate_instances_split(program: TurtleProgram, codes: np.ndarray, resources: List[Optional[Mesh]],
+                             max_workers: int = None, mp_context=None) -> List[InstanceBatch]:
+    """
+    Interpret one assembled L-System across a process pool, by splitting it at its brackets.
+    The result is the same as TurtleProgram.run on the whole program, which raises IndexError on a ']' with no '['
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # a few jobs per worker keeps them busy even though branches differ in size
+    chunk_size = max(len(codes) // (max_workers * 4), 1)
+    batches = [InstanceBatch(i, mesh) for i, mesh in enumerate(resources)]
+    with create_pool(max_workers, mp_context) as pool:
+        pieces = []
+        try:
+            _split(program, _balance(codes), bytecode.initial_state(), len(resources), pool, chunk_size, pieces)
+        except BaseException:
+            discard_pending([piece for piece in pieces if isinstance(piece, Future)])
+            raise
+        for i, piece in enumerate(pieces):
+            if isinstance(piece, Future):
+                try:
+                    shared = piece.result()
+                except BaseException:
+                    discard_pending([p for p in pieces[i + 1:] if isinstance(p, Future)])
+                    raise
+                piece = collect_batches(shared, resources)
+            for batch, part in zip(batches, piece):
+                batch.extend(part.matrices)
+    return batches
@@ -1,13 +1,23 @@
-from typing import List, Dict, Callable, Optional
+import copy
+import random
+from typing import List, Dict, Callable, Optional, Iterator, Set
 import numpy as np
 from main.core.entity import Entity
 from main.graphics.mesh import Mesh
+from main.lsystems import bytecode
+from main.lsystems.bytecode import TurtleProgram
+from main.lsystems.instances import InstanceBatch
+from main.lsystems.memo import SubtreeCache, UnbalancedChunk
+from main.lsystems.rules import RuleSet, RuleDefinition, strip_parameters, split_context, split_module, \
+    successor_text
 from main.math.transform import Spatial
 
 
 class Turtle:
     # any state that is preserved, pushed or popped during the turtle's movement should be here
     # make sure to keep the copy method updated (it's important)
+    __slots__ = ('spatial', 'resource')
+
     def __init__(self):
         self.spatial: 'Spatial' = Spatial()
         self.resource: int = -1
@@ -27,22 +37,61 @@ class LSystemGenerator:
     Use a parsed L-System to generate geometry
     """
 
-    def __init__(self, lsystem: 'LSystem'):
+    def __init__(self, lsystem: 'LSystem', lazy: bool = False, workers: int = None, memoize: bool = False):
         self.lsystem = lsystem
+        # lazy generators never build the full sequence, see walk_sequence
+        self.lazy = lazy
+        # if set, generate_instances splits the sequence at its brackets and interprets the branches in this many processes
+        self.workers = workers
+        if self.lazy and self.workers is not None:
+            raise Exception("A lazy L-System generator can't be split across workers.")
+        if self.lazy and not lsystem.is_deterministic():
+            raise Exception("Stochastic, parametric and context-sensitive L-Systems can't be generated lazily.")
+        # if set, repeated (symbol, depth) expansions are derived and interpreted once, see SubtreeCache
+        self.cache: SubtreeCache = None
+        if memoize:
+            if lsystem.is_deterministic():
+                self.cache = SubtreeCache(lsystem)
+            else:
+                print('L-System rules are stochastic, parametric or context-sensitive, not using the subtree cache')
         # at render
         self.sequence = self.lsystem.axiom
         self.turtle_stack: List[Turtle] = []
         self.turtle = Turtle()  # we will consider the 'forward' axis being the Y axis
-
-        self.generate_sequence()
-
-    def generate_system(self) -> Entity:
+        # compiled rules and random state of a derivation, if the rules aren't deterministic and context-free
+        self.rules: RuleSet = None
+        self.rng: random.Random = None
+        # the LSystem fields the sequence and the instances were last made with, see update
+        self.derived_fields: Dict[str, object] = {}
+        self.interpreted_fields: Dict[str, object] = {}
+        self.instances: List[InstanceBatch] = None
+
+        if not self.lazy:
+            self.generate_sequence()
+
+    def generate_system(self, batched: bool = False, dag: bool = False) -> Entity:
         # run the turtle through the list of commands
-        # return all the meshes todo instanced rendering
+        # return all the meshes, or one node per resource holding all of its instances if batched
+        # (see mesh_generator.create_lsystem for drawing those with instanced rendering),
+        # or a DAGEntity holding each unique subtree once if dag
+        if dag and not self.lsystem.is_deterministic():
+            print('L-System rules are stochastic, parametric or context-sensitive, not building a DAG')
+            dag, batched = False, True
+        if dag:
+            from main.lsystems.dag import LSystemDAG, DAGEntity
+            try:
+                return DAGEntity('l-system-root', LSystemDAG(self.lsystem))
+            except UnbalancedChunk:
+                print('L-System rules have unbalanced brackets, not building a DAG')
+                batched = True
+        if batched:
+            return LSystemGenerator.batched_system(self.generate_instances())
+        self.reset_turtle()
         root = Entity('l-system-root')
         root.transform = self.turtle.spatial.config_transform(root.transform)
         meshes: List[Entity] = []
-        for command in self.sequence:
+        commands = self.walk_sequence() if self.lazy else self.sequence
+        for command in commands:
             if LSystem.is_action(command):
                 ent: Entity = LSystem.ACTIONS[command](self)
                 if ent is not None:
@@ -54,19 +103,131 @@ class LSystemGenerator:
                 self.turtle.resource = int(command)
         return root
 
+    @staticmethod
+    def batched_system(batches: List[InstanceBatch]) -> Entity:
+        # one node per resource, each holding all of that resource's instances
+        root = Entity('l-system-root')
+        root.transform = Turtle().spatial.config_transform(root.transform)
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            ent = Entity('l-system-%d' % batch.resource)
+            ent.mesh = batch.mesh
+            ent.instances = batch
+            ent.parent = root
+            ent.transform._elem = ent
+            root.children.append(ent)
+        return root
+
+    def generate_instances(self) -> List[InstanceBatch]:
+        """
+        Run the turtle and write the model matrix of every drawn resource into per-resource buffers,
+        instead of creating an Entity for each one. Returns one batch per slot in LSystem.resources
+        """
+        if self.cache is not None:
+            try:
+                return self.cache.generate_instances()
+            except UnbalancedChunk:
+                print('L-System rules have unbalanced brackets, not using the subtree cache')
+        program = self.lsystem.compile_actions()
+        if self.lazy:
+            codes = (program.opcode(ch) for ch in self.walk_sequence())
+            return program.run(codes, self.lsystem.resources)
+        codes = program.assemble(self.sequence)
+        if self.workers is not None:
+            from main.lsystems.parallel import generate_instances_split
+            return generate_instances_split(program, codes, self.lsystem.resources, self.workers)
+        return program.run(codes.tolist(), self.lsystem.resources, stack_capacity=bytecode.max_depth(codes))
+
+    def reset_turtle(self):
+        self.turtle_stack = []
+        self.turtle = Turtle()
+
     def generate_sequence(self):
         print('generating sequence . . . ', end='')
         self.sequence = self.lsystem.axiom
-        for i in range(self.lsystem.iterations):
-            self._iterate()
-
-        print('done: %s' % self.sequence)
+        if self.cache is not None:
+            self.sequence = self.cache.expand_sequence(self.lsystem.axiom, self.lsystem.iterations)
+        else:
+            self.rules = None if self.lsystem.is_deterministic() else self.lsystem.compile_rules()
+            # the same seed always derives the same tree
+            self.rng = random.Random(self.lsystem.seed)
+            for i in range(self.lsystem.iterations):
+                self._iterate()
+            if self.rules is not None:
+                self.sequence = strip_parameters(self.sequence)
+        self.derived_fields = self.lsystem.get_fields(LSystem.DERIVATION_FIELDS)
+
+        print('done: %d symbols' % len(self.sequence))
+
+    def update(self) -> List[InstanceBatch]:
+        """
+        Bring the instances up to date with the LSystem after its fields were changed, re-running only what depends
+        on the changed fields: the turtle parameters only need the sequence interpreted again, and with memoize
+        only the subtrees of letters whose rules changed are derived again
+        """
+        derived = self.lsystem.get_fields(LSystem.DERIVATION_FIELDS)
+        interpreted = self.lsystem.get_fields(LSystem.INTERPRETATION_FIELDS)
+        derivation_changed = [f for f, v in derived.items() if self.derived_fields.get(f) != v]
+        interpretation_changed = interpreted != self.interpreted_fields
+        if not derivation_changed and not interpretation_changed and self.instances is not None:
+            return self.instances
+
+        if self.cache is not None and not self.lsystem.is_deterministic():
+            print('L-System rules are stochastic, parametric or context-sensitive, not using the subtree cache')
+            self.cache = None
+        if self.cache is not None:
+            if 'rules' in derivation_changed:
+                self.cache.invalidate(self.lsystem.affected_letters(self.derived_fields.get('rules', {})))
+            if interpretation_changed:
+                self.cache.clear_geometry()
+
+        if self.lazy:
+            self.derived_fields = derived
+        elif derivation_changed == ['iterations'] and self.cache is None and self.lsystem.is_deterministic() \
+                and self.lsystem.iterations > self.derived_fields['iterations']:
+            # more iterations of the same rules just carry on from the current sequence
+            for i in range(self.lsystem.iterations - self.derived_fields['iterations']):
+                self._iterate()
+            self.derived_fields = derived
+        elif derivation_changed:
+            self.generate_sequence()
+
+        self.instances = self.generate_instances()
+        self.interpreted_fields = interpreted
+        return self.instances
+
+    def walk_sequence(self) -> Iterator[str]:
+        """
+        Expand the axiom depth-first and yield the symbols of the final sequence in order,
+        without ever building it. Memory is bounded by the iteration depth instead of the sequence length.
+        """
+        successors: Dict[str, str] = {}
+        iterations = self.lsystem.iterations
+        # each frame is the remaining symbols of one expansion and the depth they were produced at
+        stack = [(iter(self.lsystem.axiom), 0)]
+        while stack:
+            symbols, depth = stack[-1]
+            for ch in symbols:
+                if depth < iterations and not (LSystem.is_action(ch) or LSystem.is_resource(ch)):
+                    if ch not in successors:
+                        successors[ch] = self.lsystem.get_rule(ch)
+                    stack.append((iter(successors[ch]), depth + 1))
+                    break
+                yield ch
+            else:
+                stack.pop()
 
     def _iterate(self):
-        new_seq = ""
-        for ch in self.sequence:
-            new_seq += self.lsystem.get_rule(ch)
-        self.sequence = new_seq
+        if self.rules is not None:
+            # stochastic, parametric or context-sensitive rules go through the compiled matcher,
+            # which indexes the brackets of the sequence once per generation for context lookups
+            self.sequence = self.rules.rewrite(self.sequence, self.rng)
+            return
+        # context-free rules only depend on the symbol itself, so a whole generation
+        # can be rewritten in one linear pass with a translation table
+        table = self.lsystem.get_translation_table(set(self.sequence))
+        self.sequence = self.sequence.translate(table)
 
     def get_current_mesh(self) -> Mesh:
         return self.lsystem.resources[self.turtle.resource]
@@ -147,6 +308,29 @@ class LSystem:
         '`': LSystemGenerator.action_increase_resource,
         '~': LSystemGenerator.action_decrease_resource
     }
+    # the same actions for the compiled interpreter, see bytecode.TurtleProgram
+    OPCODES: Dict[str, int] = {
+        '+': bytecode.FORWARD,
+        '-': bytecode.BACKWARD,
+        '*': bytecode.ROTATE + 0,
+        '!': bytecode.ROTATE + 1,
+        '^': bytecode.ROTATE + 2,
+        '&': bytecode.ROTATE + 3,
+        '@': bytecode.ROTATE + 4,
+        '$': bytecode.ROTATE + 5,
+        '_': bytecode.SCALE_DOWN,
+        '=': bytecode.SCALE_UP,
+        '[': bytecode.PUSH,
+        ']': bytecode.POP,
+        '#': bytecode.DRAW,
+        '`': bytecode.NEXT_RESOURCE,
+        '~': bytecode.PREV_RESOURCE,
+        **{str(i): bytecode.SET_RESOURCE + i for i in range(10)}
+    }
+
+    # the fields the derived sequence depends on, everything else only changes how it's interpreted
+    DERIVATION_FIELDS = ('axiom', 'iterations', 'rules', 'seed')
+    INTERPRETATION_FIELDS = ('unit_length', 'pitch_angle', 'spin_angle', 'binormal_angle', 'scale_multiplier')
 
     @staticmethod
     def is_action(ch: str):
@@ -166,7 +350,45 @@ class LSystem:
         self.binormal_angle = 5
         self.scale_multiplier = 1.1
         self.axiom = ""
-        self.rules: Dict[str, str] = {}
+        # letter -> successor, or to Productions for stochastic and parametric rules (see rules.py).
+        # letters can have a left and right context, as in A<B>C
+        self.rules: Dict[str, RuleDefinition] = {}
+        self.seed = 0  # for stochastic rules
+
+    def without_resources(self) -> 'LSystem':
+        # a copy that can be sent to other processes, the meshes hold gl handles
+        ls = copy.copy(self)
+        ls.resources = [None for r in self.resources]
+        return ls
+
+    def get_fields(self, names) -> Dict[str, object]:
+        # a copy of the fields, to compare against later
+        return {name: copy.deepcopy(getattr(self, name)) for name in names}
+
+    def affected_letters(self, old_rules: Dict[str, RuleDefinition]) -> Set[str]:
+        # letters whose expansion changed since the rules were old_rules: the ones with a different rule,
+        # and any letter whose rule uses one of those. Rule keys can carry parameters and context, 'X<A(l)>Y'
+        def letter(key: str) -> str:
+            return split_module(split_context(key)[1])[0]
+
+        changed = {k for k in set(old_rules.keys()) | set(self.rules.keys()) if old_rules.get(k) != self.rules.get(k)}
+        affected = {letter(k) for k in changed}
+        uses = [(letter(k), set(successor_text(successor))) for k, successor in self.rules.items()]
+        grew = True
+        while grew:
+            grew = False
+            for ch, used in uses:
+                if ch not in affected and not used.isdisjoint(affected):
+                    affected.add(ch)
+                    grew = True
+        return affected
+
+    def is_deterministic(self) -> bool:
+        # every letter has exactly one successor, no parameters and no context, so it always expands the same way
+        return all(isinstance(successor, str) and len(letter) == 1 for letter, successor in self.rules.items())
+
+    def compile_rules(self) -> RuleSet:
+        return RuleSet(self.rules)
 
     def get_rule(self, ch: str):
         if LSystem.is_action(ch) or LSystem.is_resource(ch):
@@ -175,3 +397,22 @@ class LSystem:
             return self.rules[ch]
         print('bad character %s' % ch)
         return ''
+
+    def compile_actions(self) -> TurtleProgram:
+        table = np.zeros(256, dtype='uint8')
+        for ch, op in LSystem.OPCODES.items():
+            table[ord(ch)] = op
+        # in the same order as the ROTATE opcodes above
+        rotations = np.array([
+            bytecode.local_rotation(1, self.spin_angle / 180 * np.pi),
+            bytecode.local_rotation(1, -self.spin_angle / 180 * np.pi),
+            bytecode.local_rotation(2, self.pitch_angle / 180 * np.pi),
+            bytecode.local_rotation(2, -self.pitch_angle / 180 * np.pi),
+            bytecode.local_rotation(0, self.binormal_angle / 180 * np.pi),
+            bytecode.local_rotation(0, -self.binormal_angle / 180 * np.pi),
+        ])
+        return TurtleProgram(table, rotations, self.unit_length, self.scale_multiplier)
+
+    def get_translation_table(self, symbols) -> Dict[int, str]:
+        # maps each symbol (by ordinal) to its successor, for use with str.translate
+        return {ord(ch): self.get_rule(ch) for ch in symbols}
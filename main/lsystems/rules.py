@@ -0,0 +1,371 @@
+import ast
+import keyword
+import math
+import random
+import re
+from bisect import bisect
+from typing import List, Dict, Callable, Optional, Union, Tuple
+
+import numpy as np
+
+# a letter and its parameter list, if it has one: A or A(1.0,0.5)
+MODULE = re.compile(r'([^\[\]+\-*!^&@$_=#`~0-9(),])(?:\(([^()]*)\))?')
+# everything MODULE doesn't take for a letter
+NOT_LETTERS = np.array([ord(ch) for ch in '[]+-*!^&@$_=#`~0123456789(),'], dtype='uint32')
+# the parameter lists of a sequence, which the turtle doesn't read
+PARAMETERS = re.compile(r'\([^()]*\)')
+# what conditions and parameter expressions can use besides the letter's parameters. Only functions that can't
+# be made to run for long: nothing like factorial or comb, which take arbitrarily big integers
+EXPRESSION_NAMES = {**{k: getattr(math, k) for k in (
+    'pi', 'e', 'tau', 'inf', 'sqrt', 'exp', 'log', 'log2', 'log10', 'pow', 'hypot', 'sin', 'cos', 'tan', 'asin',
+    'acos', 'atan', 'atan2', 'sinh', 'cosh', 'tanh', 'degrees', 'radians', 'fabs', 'fmod', 'copysign', 'floor',
+    'ceil', 'trunc')}, 'min': min, 'max': max, 'abs': abs}
+# a ** b is compiled to a call of this: float powers overflow right away, where 9**9**9 on integers never finishes
+POWER = '_power'
+# the only syntax they can use: numbers, names, arithmetic, comparisons and calls of EXPRESSION_NAMES
+EXPRESSION_NODES = (ast.Expression, ast.Constant, ast.Name, ast.Load, ast.BinOp, ast.UnaryOp, ast.BoolOp,
+                    ast.Compare, ast.IfExp, ast.Call,
+                    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+                    ast.Not, ast.And, ast.Or, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class Production:
+    """
+    One possible successor of a letter. Among the productions of a letter whose condition holds,
+    one is picked at random with probability proportional to its weight.
+    The condition and any parameter lists in the successor are arithmetic expressions of the letter's parameters
+    (see parse_expression), e.g. the letter 'A(l,w)' with Production('#+A(l*0.8,w)', condition='l > 0.1')
+    """
+
+    def __init__(self, successor: str, weight: float = 1.0, condition: str = None):
+        self.successor = successor
+        self.weight = weight
+        self.condition = condition
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Production) and \
+            (self.successor, self.weight, self.condition) == (other.successor, other.weight, other.condition)
+
+    def __hash__(self) -> int:
+        return hash((self.successor, self.weight, self.condition))
+
+    def __str__(self) -> str:
+        return f"Production({self.successor}, weight={self.weight}, condition={self.condition})"
+
+
+# what LSystem.rules maps a letter (optionally with its parameter names, 'A(l,w)', and its context, 'X<A(l,w)>Y') to
+RuleDefinition = Union[str, Production, List[Production]]
+
+
+def successor_text(definition: RuleDefinition) -> str:
+    # every successor a rule can produce, run together, for looking at which letters it uses
+    if isinstance(definition, Production):
+        return definition.successor
+    if isinstance(definition, list):
+        return ''.join(production.successor for production in definition)
+    return definition
+
+
+def split_context(key: str) -> Tuple[str, str, str]:
+    # 'X<A(l)>Y' -> ('X', 'A(l)', 'Y'), the parameters of the context letters aren't used
+    left, right = '', ''
+    if '<' in key:
+        left, key = key.split('<', 1)
+    if '>' in key:
+        key, right = key.split('>', 1)
+    return strip_parameters(left), key, strip_parameters(right)
+
+
+def split_module(module: str) -> Tuple[str, List[str]]:
+    # 'A(l, w)' -> ('A', ['l', 'w'])
+    match = MODULE.fullmatch(module.replace(' ', ''))
+    if match is None:
+        raise Exception("Bad L-System letter: %s" % module)
+    args = match.group(2)
+    return match.group(1), args.split(',') if args else []
+
+
+def strip_parameters(sequence: str) -> str:
+    return PARAMETERS.sub('', sequence)
+
+
+def _format(value) -> str:
+    return repr(float(value))
+
+
+def _split_arguments(text: str) -> List[str]:
+    # split on the commas that aren't nested in parentheses
+    args, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(text[start:i])
+            start = i + 1
+    args.append(text[start:])
+    return args
+
+
+def parse_expression(text: str, params: List[str]) -> ast.expr:
+    """
+    Parse a condition or parameter expression from an L-System definition. Anything but plain arithmetic
+    of the letter's parameters (attributes, subscripts, lambdas, unknown names...) raises an Exception,
+    so loading a ruleset can never run code
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError:
+        raise Exception("Bad L-System expression: %s" % text)
+    for node in ast.walk(tree):
+        if not isinstance(node, EXPRESSION_NODES):
+            raise Exception("Unsupported syntax %s in L-System expression: %s" % (type(node).__name__, text))
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or
+                                               not isinstance(node.value, (int, float))):
+            raise Exception("Only numbers can be used in L-System expressions: %s" % text)
+        if isinstance(node, ast.Name) and node.id not in params and node.id not in EXPRESSION_NAMES:
+            raise Exception("Unknown name %s in L-System expression: %s" % (node.id, text))
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id in params or
+                                           not callable(EXPRESSION_NAMES.get(node.func.id)) or node.keywords):
+            raise Exception("Only the math functions can be called in L-System expressions: %s" % text)
+    return tree.body
+
+
+class _FloatPower(ast.NodeTransformer):
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Pow):
+            return node
+        return ast.Call(func=ast.Name(id=POWER, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+
+
+def compile_expressions(bodies: List[ast.expr], params: List[str]) -> Callable:
+    # a function of the letter's parameters returning the value of each (already checked) expression
+    for name in params:
+        if not name.isidentifier() or keyword.iskeyword(name) or name == POWER:
+            raise Exception("Bad L-System parameter name: %s" % name)
+    bodies = [_FloatPower().visit(body) for body in bodies]
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(arg=name) for name in params], kwonlyargs=[],
+                         kw_defaults=[], defaults=[])
+    function = ast.Expression(ast.Lambda(args=args, body=ast.Tuple(elts=bodies, ctx=ast.Load())))
+    code = compile(ast.fix_missing_locations(function), '<l-system>', 'eval')
+    return eval(code, {'__builtins__': {}, **EXPRESSION_NAMES, POWER: math.pow})
+
+
+def compile_condition(condition: str, params: List[str]) -> Callable:
+    values = compile_expressions([parse_expression(condition, params)], params)
+    return lambda *args: values(*args)[0]
+
+
+def compile_successor(successor: str, params: List[str]) -> Union[str, Callable]:
+    """
+    A successor without parameter lists is returned as it is. Otherwise it's compiled to a single python function
+    of the letter's parameters that formats the whole successor at once
+    """
+    if '(' not in successor:
+        return successor
+    literal, expressions = [], []
+    i = 0
+    while i < len(successor):
+        ch = successor[i]
+        if ch != '(':
+            literal.append('%%' if ch == '%' else ch)
+            i += 1
+            continue
+        # find the matching parenthesis, expressions can have their own
+        depth, end = 0, i
+        while end < len(successor):
+            if successor[end] == '(':
+                depth += 1
+            elif successor[end] == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+            end += 1
+        if depth != 0:
+            raise Exception("Unbalanced parentheses in L-System successor: %s" % successor)
+        args = _split_arguments(successor[i + 1:end])
+        literal.append('(' + ','.join(['%s'] * len(args)) + ')')
+        expressions += [parse_expression(a, params) for a in args]
+        i = end + 1
+    template = ''.join(literal)
+    values = compile_expressions(expressions, params)
+    return lambda *args: template % tuple(_format(v) for v in values(*args))
+
+
+class ContextIndex:
+    """
+    The left and right context of every letter of one generation, by position in the sequence.
+    Turtle actions, resources and parameter lists aren't context. A branch is skipped over to the right,
+    and to the left a letter sees past the start of its branch into its parent, but never into a closed branch.
+    Built once per generation from the bracket matches, so each lookup is a list index
+    """
+
+    def __init__(self, sequence: str):
+        chars = np.frombuffer(sequence.encode('utf-32-le'), dtype='uint32')
+        nesting = np.cumsum((chars == ord('(')).astype('int64') - (chars == ord(')')))
+        letters = np.isin(chars, NOT_LETTERS, invert=True) & (nesting == 0)
+        opens = chars == ord('[')
+        closes = chars == ord(']')
+        # only letters and brackets matter from here on
+        positions = np.flatnonzero(letters | opens | closes).tolist()
+        kinds = chars[positions].tolist()
+        is_letter = letters[positions].tolist()
+        count = len(positions)
+
+        # matching bracket of each bracket (or -1), as an index into positions
+        match = [-1] * count
+        stack = []
+        for k in range(count):
+            if kinds[k] == ord('['):
+                stack.append(k)
+            elif kinds[k] == ord(']') and stack:
+                match[k] = stack.pop()
+                match[match[k]] = k
+
+        self.left: List[int] = [-1] * len(sequence)
+        self.right: List[int] = [-1] * len(sequence)
+        # what a letter right after positions[k] sees to its left: a '[' sees what is before it,
+        # and a ']' sees what its '[' sees
+        seen = -1
+        before = [-1] * count
+        for k in range(count):
+            if is_letter[k]:
+                self.left[positions[k]] = seen
+                seen = positions[k]
+            elif kinds[k] == ord(']') and match[k] >= 0:
+                seen = before[match[k]]
+            before[k] = seen
+        # what a letter right before positions[k] sees to its right: a '[' skips its branch,
+        # and a ']' ends the branch so there is nothing
+        seen = -1
+        after = [-1] * count
+        for k in range(count - 1, -1, -1):
+            if is_letter[k]:
+                self.right[positions[k]] = seen
+                seen = positions[k]
+            elif kinds[k] == ord('['):
+                seen = after[match[k] + 1] if 0 <= match[k] < count - 1 else -1
+            else:
+                seen = -1
+            after[k] = seen
+
+    def matches(self, sequence: str, position: int, left: str, right: str) -> bool:
+        p = position
+        for ch in reversed(left):
+            p = self.left[p]
+            if p < 0 or sequence[p] != ch:
+                return False
+        p = position
+        for ch in right:
+            p = self.right[p]
+            if p < 0 or sequence[p] != ch:
+                return False
+        return True
+
+
+class CompiledRule:
+    """
+    The productions of one letter, with their conditions and successors compiled to python functions
+    """
+
+    def __init__(self, letter: str, params: List[str], productions: List[Production]):
+        self.letter = letter
+        self.params = params
+        self.conditions: List[Optional[Callable]] = [
+            compile_condition(p.condition, params) if p.condition else None for p in productions]
+        self.successors = [compile_successor(p.successor, params) for p in productions]
+        self.weights = [p.weight for p in productions]
+        self.conditional = any(c is not None for c in self.conditions)
+        # unconditional productions are picked from their precomputed cumulative weights
+        self.cumulative: List[float] = []
+        total = 0.0
+        for w in self.weights:
+            total += w
+            self.cumulative.append(total)
+        # a single unconditional production without parameters always rewrites to the same string
+        self.constant: Optional[str] = None
+        if len(productions) == 1 and not self.conditional and isinstance(self.successors[0], str):
+            self.constant = self.successors[0]
+
+    def _values(self, args: Optional[str]) -> List[float]:
+        # missing parameters are 0, extra ones are ignored
+        values = [float(a) for a in args.split(',')] if args else []
+        values += [0.0] * (len(self.params) - len(values))
+        return values[:len(self.params)]
+
+    def apply(self, args: Optional[str], rng: random.Random) -> Optional[str]:
+        # the successor of one occurrence of the letter, or None if none of its conditions hold
+        if self.constant is not None:
+            return self.constant
+        values = self._values(args)
+        if self.conditional:
+            candidates = [i for i, c in enumerate(self.conditions) if c is None or c(*values)]
+            if len(candidates) == 0:
+                return None
+            if len(candidates) == 1:
+                choice = candidates[0]
+            else:
+                pick = rng.random() * sum(self.weights[i] for i in candidates)
+                for choice in candidates:
+                    pick -= self.weights[choice]
+                    if pick < 0:
+                        break
+        elif len(self.successors) == 1:
+            choice = 0
+        else:
+            choice = min(bisect(self.cumulative, rng.random() * self.cumulative[-1]), len(self.successors) - 1)
+        successor = self.successors[choice]
+        return successor if isinstance(successor, str) else successor(*values)
+
+
+class RuleSet:
+    """
+    The rules of an LSystem compiled into a matcher that rewrites a whole generation in one regex pass.
+    Productions with a context take precedence over the context-free ones of the same letter
+    """
+
+    def __init__(self, rules: Dict[str, RuleDefinition]):
+        self.rules: Dict[str, CompiledRule] = {}
+        self.contextual: Dict[str, List[Tuple[str, str, CompiledRule]]] = {}
+        for key, definition in rules.items():
+            left, module, right = split_context(key)
+            letter, params = split_module(module)
+            if isinstance(definition, str):
+                definition = [Production(definition)]
+            elif isinstance(definition, Production):
+                definition = [definition]
+            rule = CompiledRule(letter, params, definition)
+            if left or right:
+                self.contextual.setdefault(letter, []).append((left, right, rule))
+            else:
+                self.rules[letter] = rule
+        self._unknown = set()
+
+    def rewrite(self, sequence: str, rng: random.Random) -> str:
+        rules = self.rules
+        contextual = self.contextual
+        index = ContextIndex(sequence) if contextual else None
+
+        def replace(match) -> str:
+            letter = match.group(1)
+            if letter in contextual:
+                for left, right, rule in contextual[letter]:
+                    if index.matches(sequence, match.start(), left, right):
+                        successor = rule.apply(match.group(2), rng)
+                        if successor is not None:
+                            return successor
+            rule = rules.get(letter)
+            if rule is None:
+                if letter in contextual:
+                    return match.group(0)
+                if letter not in self._unknown:
+                    self._unknown.add(letter)
+                    print('bad character %s' % letter)
+                return ''
+            successor = rule.apply(match.group(2), rng)
+            # a letter none of whose conditions hold stays as it is
+            return match.group(0) if successor is None else successor
+
+        return MODULE.sub(replace, sequence)
@@ -0,0 +1,131 @@
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from main.lsystems.bake import BakedGeometry
+from main.lsystems.instances import InstanceBatch
+
+
+def find_chains(starts: np.ndarray, ends: np.ndarray, directions: np.ndarray, epsilon: float = 1e-4) -> List[List[int]]:
+    """
+    Link segments into chains, a segment continuing the one that ends where it starts.
+    Where a branch splits, the chain carries on into the straightest continuation and the others start their own
+    """
+    # the same point can come out slightly differently from different turtle paths, so match them on a grid
+    points = np.round(np.concatenate([starts, ends]) / epsilon).astype('int64')
+    _, ids = np.unique(points, axis=0, return_inverse=True)
+    ids = ids.ravel()
+    start_ids, end_ids = ids[:len(starts)].tolist(), ids[len(starts):].tolist()
+    starting_at: Dict[int, List[int]] = {}
+    for s, point in enumerate(start_ids):
+        starting_at.setdefault(point, []).append(s)
+    unit = directions / np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+
+    following = [-1] * len(starts)
+    has_previous = [False] * len(starts)
+    for s, point in enumerate(end_ids):
+        candidates = [t for t in starting_at.get(point, ()) if not has_previous[t] and t != s]
+        if len(candidates) == 0:
+            continue
+        t = max(candidates, key=lambda c: float(unit[s] @ unit[c]))
+        following[s] = t
+        has_previous[t] = True
+
+    chains = []
+    for s in range(len(starts)):
+        if has_previous[s]:
+            continue
+        chain = [s]
+        while following[chain[-1]] >= 0 and len(chain) <= len(starts):
+            chain.append(following[chain[-1]])
+        chains.append(chain)
+    return chains
+
+
+def sweep_tubes(matrices: np.ndarray, unit_length: float, radius: float = 0.1, sides: int = 8,
+                tip_taper: float = 0.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sweep tapered tubes along the segments drawn at turtle matrices, one continuous tube per chain of segments.
+    Consecutive segments of a chain share the ring between them. The radius follows the turtle's scale.
+    Returns positions, normals, uvs and triangle indices
+    """
+    matrices = np.asarray(matrices, dtype='float64')
+    if len(matrices) == 0:
+        return np.zeros((0, 3), 'float32'), np.zeros((0, 3), 'float32'), np.zeros((0, 2), 'float32'), \
+            np.zeros(0, 'uint32')
+    starts = matrices[:, :3, 3]
+    directions = matrices[:, :3, 1] * unit_length
+    ends = starts + directions
+    radii = np.linalg.norm(matrices[:, :3, 0], axis=1) * radius
+    chains = find_chains(starts, ends, directions)
+
+    # one flat row per ring, chain after chain: chain c has lengths[c] segments and lengths[c] + 1 rings,
+    # so everything below is linear in the number of segments however uneven the chains are
+    lengths = np.array([len(c) for c in chains])
+    rings = lengths + 1
+    flat = np.concatenate(chains)  # the segments of every chain, in order
+    first_segment = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    first_ring = np.concatenate([[0], np.cumsum(rings)[:-1]])
+    ring_chain = np.repeat(np.arange(len(chains)), rings)
+    ring = np.arange(rings.sum()) - first_ring[ring_chain]  # index of each ring within its chain
+    chain_length = lengths[ring_chain]
+
+    # ring j sits at the start of segment j, and the last one at the end of the last segment
+    ring_segment = flat[first_segment[ring_chain] + np.minimum(ring, chain_length - 1)]
+    is_tip = ring == chain_length
+    centers = np.where(is_tip[:, np.newaxis], ends[ring_segment], starts[ring_segment])
+    ring_radii = np.where(is_tip, radii[ring_segment] * tip_taper, radii[ring_segment])
+    # rings between two segments face halfway between them
+    unit = directions / np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+    previous = flat[first_segment[ring_chain] + np.clip(ring - 1, 0, chain_length - 1)]
+    tangents = unit[ring_segment] + np.where(((ring > 0) & ~is_tip)[:, np.newaxis], unit[previous], 0.0)
+    tangents /= np.maximum(np.linalg.norm(tangents, axis=1, keepdims=True), 1e-12)
+
+    # carry the first segment's i axis along each chain (parallel transport), so the tubes don't twist.
+    # With the chains longest first, the ones still going at ring j are always a prefix of them
+    by_length = np.argsort(-rings, kind='stable')
+    going = np.searchsorted(-rings[by_length], -np.arange(rings.max()), side='left')
+    normals = np.zeros_like(tangents)
+    n = matrices[flat[first_segment[by_length]], :3, 0]
+    for j, count in enumerate(going):
+        n = n[:count]
+        rows = first_ring[by_length[:count]] + j
+        t = tangents[rows]
+        n = n - np.sum(n * t, axis=1, keepdims=True) * t
+        n /= np.maximum(np.linalg.norm(n, axis=1, keepdims=True), 1e-12)
+        normals[rows] = n
+    binormals = np.cross(tangents, normals)
+
+    # sides + 1 vertices per ring, the last one repeats the first with u = 1
+    angles = np.linspace(0.0, 2.0 * np.pi, sides + 1)
+    around = np.cos(angles)[:, np.newaxis] * normals[:, np.newaxis] + \
+        np.sin(angles)[:, np.newaxis] * binormals[:, np.newaxis]  # (ring, side, 3)
+    positions = (centers[:, np.newaxis] + ring_radii[:, np.newaxis, np.newaxis] * around).reshape(-1, 3)
+    normals_out = around.reshape(-1, 3)
+    # v runs along the chain in units of the turtle's step
+    steps = np.zeros(len(centers))
+    steps[1:] = np.linalg.norm(np.diff(centers, axis=0), axis=1)
+    steps[ring == 0] = 0.0
+    travelled = np.cumsum(steps)
+    v = (travelled - travelled[first_ring][ring_chain]) / unit_length
+    uvs = np.stack(np.broadcast_arrays(angles[np.newaxis] / (2.0 * np.pi), v[:, np.newaxis]), axis=2).reshape(-1, 2)
+
+    # two triangles for each side between each ring and the next
+    a = np.flatnonzero(~is_tip)[:, np.newaxis] * (sides + 1) + np.arange(sides)
+    b = a + sides + 1
+    indices = np.stack([a, b, a + 1, a + 1, b, b + 1], axis=2).reshape(-1)
+    return positions.astype('float32'), normals_out.astype('float32'), uvs.astype('float32'), \
+        indices.astype('uint32')
+
+
+def tube_geometry(batches: List[InstanceBatch], resources: List[int], unit_length: float, radius: float = 0.1,
+                  sides: int = 8) -> BakedGeometry:
+    """
+    Every instance of the given resources swept into tubes, as one mesh drawn with the first resource's material
+    """
+    used = [b for b in batches if b.resource in resources and len(b) > 0]
+    matrices = np.concatenate([b.matrices for b in used] + [np.zeros((0, 4, 4), 'float32')])
+    positions, normals, uvs, indices = sweep_tubes(matrices, unit_length, radius, sides)
+    mesh = used[0].mesh if len(used) > 0 else None
+    return BakedGeometry(resources[0], [('position', 3), ('normal', 3), ('texcoord_0', 2)],
+                         np.concatenate([positions, normals, uvs], axis=1), indices, mesh)
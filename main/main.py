@@ -7,14 +7,13 @@ import OpenGL
 from main.core.entity import Entity
 from main.core.scene import Scene
 from main.graphics.mesh import Mesh
-from main.lsystems import mesh_generator, openSCAD
-from main.lsystems.parser import LSystem
+from main.lsystems import mesh_generator, openSCAD, live
 from main.math.vertex_math import norm_vec3
 
 OpenGL.USE_ACCELERATE = False
 
 import glfw
-from main.loader import scene_loader, gltf_loader
+from main.loader import scene_loader, gltf_loader, lcr_loader
 from main.util import glutil, configuration
 from main.core import game_clock, console, key_input
 
@@ -286,28 +285,18 @@ def main():
     '`' increment resource index (`)
     """
     SHOW_DEBUG_AXES = False
-    ls = LSystem()
-    ls.unit_length = 1.0
-    ls.pitch_angle = 22.5
-    ls.spin_angle = 22.5
-    ls.binormal_angle = 22.5
-    ls.scale_multiplier = 1.2
-    ls.iterations = 5
-    ls.axiom = '[S]!!!!!S'
-    ls.rules = {
-        'S': '3#+[&AB]****[&AB]*****[&AB]',
-        'A': '__3#[B]+[&AB]****[&AB]******&AB',
-        'B': '4#+1[&&#]****[&&#]****[&&#]'
-    }
     leaves = gltf_loader.load_gltf('data/gltf/lsystemassets/leaves.glb', ['maskAlpha'])
     branches = gltf_loader.load_gltf('data/gltf/lsystemassets/branches.glb')
+    resources = [None for i in range(10)]
     index = 0
     for ent in leaves + branches:
-        ls.resources[index] = ent.mesh
+        resources[index] = ent.mesh
         index += 1
     current_scene = Scene('lsystempreview')
     current_scene.elements.append(gltf_loader.load_gltf('data/gltf/env_room.glb', ['skybox', 'unlit'])[0])
-    tree = mesh_generator.create_lsystem(ls)
+    tree = mesh_generator.load_lsystem('data/scenes/basic_tree.lcr', resources)
+    # lets the ls_ console commands rebuild it
+    live.track(lcr_loader.load_lsystem('data/scenes/basic_tree.lcr'), resources, tree)
 
     openSCAD.generate_OpenSCAD_script(tree, output_file='data/OpenSCAD-scripts/out.scad', detail=12)
 
@@ -329,6 +318,7 @@ def main():
     cam.transform.set_translation(np.array([3, 3, 3]))
     cam.transform.set_rotation(matrix.quaternion_from_angles([0, np.pi/2, 0]))
     current_scene.active_camera = cam
+    current_scene.compile()
 
     fps_clock.start()
 
@@ -372,6 +362,10 @@ def main():
             should_restart = True
 
         needs_restart |= should_restart
+        # a finished L-System rebuild only ever changes the scene here, between frames
+        if live.swap():
+            current_scene.compile()
+            needs_restart = True
         render()
         imgui.new_frame()
         if console.SHOW_CONSOLE:
@@ -1,7 +1,5 @@
 import numpy as np
-from main.math import vertex_math
-
-from scipy.spatial.transform import Rotation as R
+from main.math import vertex_math, quaternion
 
 def create_new_projection_matrix(fFrustumScale, fzNear, fzFar):
     arr = np.zeros(16, dtype='float32')
@@ -41,18 +39,20 @@ def create_rotation_matrix_euler(x, y, z):
 
 def create_rotation_matrix_from_quaternion(q):
     rot = np.zeros((4, 4), dtype='float32')
-    rot[:3, :3] = R.from_quat(q).as_matrix()
+    rot[:3, :3] = quaternion.to_matrix(q)
     rot[3, 3] = 1
     return rot
 
 def quaternion_from_matrix(mat: np.ndarray):
-    return R.from_matrix(mat[:3, :3]).as_quat()
+    return quaternion.from_matrix(mat)
 
 def quaternion_from_angles(angles, degrees=False):
     # angles is angles (rad) around x y z
-    r1 = R.from_euler('y', angles[1], degrees=degrees)
-    r2 = R.from_euler('z', angles[2], degrees=degrees)
-    return (r1 * r2).as_quat()
+    if degrees:
+        angles = np.radians(angles)
+    r1 = quaternion.from_axis_angle((0.0, 1.0, 0.0), angles[1])
+    r2 = quaternion.from_axis_angle((0.0, 0.0, 1.0), angles[2])
+    return quaternion.multiply(r1, r2)
 
 def create_scale_matrix (x, y=None, z=None):
     if y is None or z is None:
@@ -0,0 +1,249 @@
+# quaternions are x y z w, the same order scipy uses, so they can be swapped in for Rotation.
+# the single quaternion functions do their math on python floats, which beats numpy (and scipy) call overhead
+# for one rotation. The batch functions take (n, 4) quaternions or (n, 3, 3) matrices, and are compiled with numba
+# if it's installed, otherwise they run as vectorized numpy
+import math
+
+import numpy as np
+
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    numba = None
+    HAS_NUMBA = False
+
+IDENTITY = np.array([0.0, 0.0, 0.0, 1.0])
+
+
+# single quaternions
+
+def normalize(q) -> np.ndarray:
+    x, y, z, w = (float(v) for v in q)
+    n = math.sqrt(x * x + y * y + z * z + w * w)
+    return np.array([x / n, y / n, z / n, w / n])
+
+
+def to_matrix(q) -> np.ndarray:
+    # 3x3 rotation matrix, q doesn't have to be normalized
+    x, y, z, w = (float(v) for v in q)
+    n = x * x + y * y + z * z + w * w
+    s = 2.0 / n if n > 0 else 0.0
+    return np.array([[1 - s * (y * y + z * z), s * (x * y - z * w), s * (x * z + y * w)],
+                     [s * (x * y + z * w), 1 - s * (x * x + z * z), s * (y * z - x * w)],
+                     [s * (x * z - y * w), s * (y * z + x * w), 1 - s * (x * x + y * y)]])
+
+
+def _tolerance(dtype) -> float:
+    # how far m m^T can be from the identity before a matrix counts as drifted. scipy's 1e-12 for doubles, but
+    # a float32 rotation is never that close, so relative to the precision the matrices are stored in
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        dtype = np.dtype('float64')
+    return max(float(np.finfo(dtype).eps) * 100, 1e-12)
+
+
+def _is_orthogonal(m00, m01, m02, m10, m11, m12, m20, m21, m22, tolerance=1e-12) -> bool:
+    # m m^T is the identity
+    return abs(m00 * m00 + m01 * m01 + m02 * m02 - 1) <= tolerance and \
+        abs(m10 * m10 + m11 * m11 + m12 * m12 - 1) <= tolerance and \
+        abs(m20 * m20 + m21 * m21 + m22 * m22 - 1) <= tolerance and \
+        abs(m00 * m10 + m01 * m11 + m02 * m12) <= tolerance and \
+        abs(m00 * m20 + m01 * m21 + m02 * m22) <= tolerance and \
+        abs(m10 * m20 + m11 * m21 + m12 * m22) <= tolerance
+
+
+def _orthogonalize(mats: np.ndarray) -> np.ndarray:
+    # the nearest rotations to (n, 3, 3) matrices that are scaled or have drifted, the same way scipy does it
+    u, _, vt = np.linalg.svd(mats, full_matrices=False)
+    return u @ vt
+
+
+def from_matrix(m) -> np.ndarray:
+    # from the rotation part of a 3x3 or 4x4 matrix, picking the numerically safest of the four cases like scipy
+    m00, m01, m02 = float(m[0][0]), float(m[0][1]), float(m[0][2])
+    m10, m11, m12 = float(m[1][0]), float(m[1][1]), float(m[1][2])
+    m20, m21, m22 = float(m[2][0]), float(m[2][1]), float(m[2][2])
+    tolerance = _tolerance(getattr(m, 'dtype', 'float64'))
+    if not _is_orthogonal(m00, m01, m02, m10, m11, m12, m20, m21, m22, tolerance):
+        (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = \
+            _orthogonalize(np.array([[[m00, m01, m02], [m10, m11, m12], [m20, m21, m22]]]))[0].tolist()
+    trace = m00 + m11 + m22
+    if trace > m00 and trace > m11 and trace > m22:
+        q = (m21 - m12, m02 - m20, m10 - m01, 1 + trace)
+    elif m00 >= m11 and m00 >= m22:
+        q = (1 - trace + 2 * m00, m10 + m01, m20 + m02, m21 - m12)
+    elif m11 >= m22:
+        q = (m01 + m10, 1 - trace + 2 * m11, m21 + m12, m02 - m20)
+    else:
+        q = (m02 + m20, m12 + m21, 1 - trace + 2 * m22, m10 - m01)
+    return normalize(q)
+
+
+def multiply(a, b) -> np.ndarray:
+    # a * b, the rotation b followed by a
+    ax, ay, az, aw = (float(v) for v in a)
+    bx, by, bz, bw = (float(v) for v in b)
+    return np.array([aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw,
+                     aw * bw - ax * bx - ay * by - az * bz])
+
+
+def from_axis_angle(axis, radians: float) -> np.ndarray:
+    # axis has to be normalized
+    s = math.sin(radians / 2.0)
+    return np.array([axis[0] * s, axis[1] * s, axis[2] * s, math.cos(radians / 2.0)])
+
+
+def rotate(q, v) -> np.ndarray:
+    # v rotated by the normalized quaternion q
+    q = np.asarray(q)
+    return v + 2.0 * np.cross(q[:3], np.cross(q[:3], v) + q[3] * v)
+
+
+# batches, numpy versions
+
+def _to_matrices_numpy(quats: np.ndarray) -> np.ndarray:
+    q = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    rot = np.empty((len(q), 3, 3), dtype=quats.dtype)
+    rot[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    rot[:, 0, 1] = 2 * (x * y - z * w)
+    rot[:, 0, 2] = 2 * (x * z + y * w)
+    rot[:, 1, 0] = 2 * (x * y + z * w)
+    rot[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    rot[:, 1, 2] = 2 * (y * z - x * w)
+    rot[:, 2, 0] = 2 * (x * z - y * w)
+    rot[:, 2, 1] = 2 * (y * z + x * w)
+    rot[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return rot
+
+
+def _from_matrices_numpy(mats: np.ndarray) -> np.ndarray:
+    m = mats[:, :3, :3]
+    diagonal = np.diagonal(m, axis1=1, axis2=2)
+    trace = diagonal.sum(axis=1)
+    choice = np.argmax(np.concatenate([diagonal, trace[:, np.newaxis]], axis=1), axis=1)
+    quats = np.empty((len(m), 4), dtype=mats.dtype)
+    # the trace case
+    rows = np.flatnonzero(choice == 3)
+    quats[rows, 0] = m[rows, 2, 1] - m[rows, 1, 2]
+    quats[rows, 1] = m[rows, 0, 2] - m[rows, 2, 0]
+    quats[rows, 2] = m[rows, 1, 0] - m[rows, 0, 1]
+    quats[rows, 3] = 1 + trace[rows]
+    # one case per largest diagonal element
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        rows = np.flatnonzero(choice == i)
+        quats[rows, i] = 1 - trace[rows] + 2 * m[rows, i, i]
+        quats[rows, j] = m[rows, j, i] + m[rows, i, j]
+        quats[rows, k] = m[rows, k, i] + m[rows, i, k]
+        quats[rows, 3] = m[rows, k, j] - m[rows, j, k]
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def _multiply_numpy(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    ax, ay, az, aw = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bx, by, bz, bw = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    return np.stack([aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw,
+                     aw * bw - ax * bx - ay * by - az * bz], axis=1)
+
+
+# batches, loops for numba to compile
+
+def _to_matrices_loop(quats: np.ndarray) -> np.ndarray:
+    rot = np.empty((quats.shape[0], 3, 3), dtype=quats.dtype)
+    for n in range(quats.shape[0]):
+        x, y, z, w = quats[n, 0], quats[n, 1], quats[n, 2], quats[n, 3]
+        s = 2.0 / (x * x + y * y + z * z + w * w)
+        rot[n, 0, 0] = 1 - s * (y * y + z * z)
+        rot[n, 0, 1] = s * (x * y - z * w)
+        rot[n, 0, 2] = s * (x * z + y * w)
+        rot[n, 1, 0] = s * (x * y + z * w)
+        rot[n, 1, 1] = 1 - s * (x * x + z * z)
+        rot[n, 1, 2] = s * (y * z - x * w)
+        rot[n, 2, 0] = s * (x * z - y * w)
+        rot[n, 2, 1] = s * (y * z + x * w)
+        rot[n, 2, 2] = 1 - s * (x * x + y * y)
+    return rot
+
+
+def _from_matrices_loop(mats: np.ndarray) -> np.ndarray:
+    quats = np.empty((mats.shape[0], 4), dtype=mats.dtype)
+    for n in range(mats.shape[0]):
+        m = mats[n]
+        trace = m[0, 0] + m[1, 1] + m[2, 2]
+        if trace > m[0, 0] and trace > m[1, 1] and trace > m[2, 2]:
+            quats[n, 0] = m[2, 1] - m[1, 2]
+            quats[n, 1] = m[0, 2] - m[2, 0]
+            quats[n, 2] = m[1, 0] - m[0, 1]
+            quats[n, 3] = 1 + trace
+        else:
+            i = 0
+            if m[1, 1] > m[i, i]:
+                i = 1
+            if m[2, 2] > m[i, i]:
+                i = 2
+            j, k = (i + 1) % 3, (i + 2) % 3
+            quats[n, i] = 1 - trace + 2 * m[i, i]
+            quats[n, j] = m[j, i] + m[i, j]
+            quats[n, k] = m[k, i] + m[i, k]
+            quats[n, 3] = m[k, j] - m[j, k]
+        length = math.sqrt(quats[n, 0] ** 2 + quats[n, 1] ** 2 + quats[n, 2] ** 2 + quats[n, 3] ** 2)
+        for c in range(4):
+            quats[n, c] /= length
+    return quats
+
+
+def _multiply_loop(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    out = np.empty((a.shape[0], 4), dtype=a.dtype)
+    for n in range(a.shape[0]):
+        ax, ay, az, aw = a[n, 0], a[n, 1], a[n, 2], a[n, 3]
+        bx, by, bz, bw = b[n, 0], b[n, 1], b[n, 2], b[n, 3]
+        out[n, 0] = aw * bx + ax * bw + ay * bz - az * by
+        out[n, 1] = aw * by - ax * bz + ay * bw + az * bx
+        out[n, 2] = aw * bz + ax * by - ay * bx + az * bw
+        out[n, 3] = aw * bw - ax * bx - ay * by - az * bz
+    return out
+
+
+if HAS_NUMBA:
+    _to_matrices = numba.njit(cache=True)(_to_matrices_loop)
+    _from_matrices = numba.njit(cache=True)(_from_matrices_loop)
+    _multiply = numba.njit(cache=True)(_multiply_loop)
+else:
+    _to_matrices = _to_matrices_numpy
+    _from_matrices = _from_matrices_numpy
+    _multiply = _multiply_numpy
+
+
+def to_matrices(quats: np.ndarray) -> np.ndarray:
+    # (n, 4) quaternions, normalized or not, to (n, 3, 3) rotation matrices
+    return _to_matrices(np.ascontiguousarray(quats))
+
+
+def from_matrices(mats: np.ndarray) -> np.ndarray:
+    # (n, 3, 3) or (n, 4, 4) rotation matrices to (n, 4) quaternions
+    mats = np.array(mats[:, :3, :3])
+    gram = mats @ mats.transpose(0, 2, 1)
+    drifted = np.flatnonzero(np.any(np.abs(gram - np.identity(3)) > _tolerance(mats.dtype), axis=(1, 2)))
+    if len(drifted) > 0:
+        mats[drifted] = _orthogonalize(mats[drifted])
+    return _from_matrices(mats)
+
+
+def multiply_batch(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # a[n] * b[n] for every n, either side can be a single quaternion
+    a, b = np.broadcast_arrays(np.atleast_2d(a), np.atleast_2d(b))
+    dtype = np.result_type(a, b)
+    return _multiply(np.ascontiguousarray(a, dtype=dtype), np.ascontiguousarray(b, dtype=dtype))
+
+
+def rotate_batch(quats: np.ndarray, vecs: np.ndarray) -> np.ndarray:
+    # vecs[n] rotated by the normalized quats[n], either side can be a single one
+    quats = np.atleast_2d(quats)
+    u = quats[:, :3]
+    return vecs + 2.0 * np.cross(u, np.cross(u, vecs) + quats[:, 3:] * vecs)
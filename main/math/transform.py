@@ -1,81 +1,191 @@
+import copy
+import threading
+from typing import List
+
 import numpy as np
-from scipy.spatial.transform import Rotation
-from main.math import vertex_math, matrix
+from main.math import vertex_math, matrix, quaternion
+
+
+class TransformPool:
+    """
+    The translation, rotation and scale of every Transform, stored as contiguous float32 arrays
+    (structure of arrays). Model matrices are only rebuilt when asked for, and then every dirty one at once
+    """
+    default: 'TransformPool' = None
+
+    def __init__(self, capacity: int = 256):
+        self.count = 0  # slots ever handed out, everything past this is unused
+        self.version = 0  # bumped whenever a transform in the pool changes
+        # released slots. Transforms can be created on any thread, so allocate takes the lock. They're released
+        # from __del__ though, which the garbage collector can run in the middle of allocate, so release never
+        # takes it: it only appends to this list, which can't be interrupted
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+        self.translations = np.zeros((0, 3), dtype='float32')
+        self.rotations = np.zeros((0, 4), dtype='float32')
+        self.scales = np.zeros((0, 3), dtype='float32')
+        self.matrices = np.zeros((0, 4, 4), dtype='float32')
+        self.dirty = np.zeros(0, dtype='bool')
+        # the version each slot last changed at. Unlike dirty these are never cleared, so a CompiledScene can tell
+        # which of its own slots moved since it last looked, whoever rebuilt the matrices in between
+        self.changed = np.zeros(0, dtype='int64')
+        self._grow(max(capacity, 1))
+
+    def _grow(self, capacity: int):
+        old = self.count
+        translations = np.zeros((capacity, 3), dtype='float32')
+        rotations = np.tile(np.array([0, 0, 0, 1], dtype='float32'), (capacity, 1))
+        scales = np.ones((capacity, 3), dtype='float32')
+        matrices = np.tile(np.identity(4, dtype='float32'), (capacity, 1, 1))
+        dirty = np.zeros(capacity, dtype='bool')
+        changed = np.zeros(capacity, dtype='int64')
+        translations[:old] = self.translations[:old]
+        rotations[:old] = self.rotations[:old]
+        scales[:old] = self.scales[:old]
+        matrices[:old] = self.matrices[:old]
+        dirty[:old] = self.dirty[:old]
+        changed[:old] = self.changed[:old]
+        self.translations, self.rotations, self.scales, self.matrices, self.dirty, self.changed = \
+            translations, rotations, scales, matrices, dirty, changed
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._free:
+                index = self._free.pop()
+            else:
+                if self.count == len(self.dirty):
+                    self._grow(len(self.dirty) * 2)
+                index = self.count
+                self.count += 1
+            self.translations[index] = 0
+            self.rotations[index] = (0, 0, 0, 1)
+            self.scales[index] = 1
+            self.dirty[index] = True
+            self.version += 1
+            self.changed[index] = self.version
+        return index
+
+    def release(self, index: int):
+        # a free slot may still be rebuilt by update if it was dirty, which is harmless
+        self._free.append(index)
+
+    def update(self):
+        # rebuild every dirty model matrix in one pass: translation * rotation * scale
+        dirty = np.flatnonzero(self.dirty[:self.count])
+        if len(dirty) == 0:
+            return
+        mats = self.matrices[dirty]
+        mats[:, :3, :3] = quaternion.to_matrices(self.rotations[dirty]) * self.scales[dirty][:, np.newaxis, :]
+        mats[:, :3, 3] = self.translations[dirty]
+        self.matrices[dirty] = mats
+        self.dirty[dirty] = False
+
+    def get_matrix(self, index: int) -> np.ndarray:
+        # a copy, the arrays are reallocated when the pool grows so a view could go stale
+        if self.dirty[index]:
+            self.update()
+        return self.matrices[index].copy()
+
+
+TransformPool.default = TransformPool()
 
 
 # A transform is a translation, rotation, and scale
 class Transform:
-    def __init__(self, scene_elem:'Entity'=None):
-        self._translation = np.array([0, 0, 0], dtype='float32')  # x y z
-        self._rotation = np.array([0, 0, 0, 1], dtype='float32')  # x y z w
-        self._scale = np.array([1, 1, 1])  # x y z
-        self._mv_needs_rebuild = True
-        self._mv: np.ndarray = None
+    """
+    A view of one slot of a TransformPool
+    """
+
+    def __init__(self, scene_elem:'Entity'=None, pool:TransformPool=None):
+        self._pool = pool if pool is not None else TransformPool.default
+        self._index = self._pool.allocate()
         self._elem = scene_elem
 
+    def __del__(self):
+        self.release()
+
+    def release(self):
+        # give the slot back to the pool, the transform can't be used after this
+        if getattr(self, '_index', -1) >= 0:
+            self._pool.release(self._index)
+            self._index = -1
+
+    def __copy__(self):
+        # never share a slot, every transform releases its own
+        return self.clone()
+
+    def __deepcopy__(self, memo):
+        new = Transform(None, self._pool)
+        memo[id(self)] = new
+        new._copy_values(self)
+        new._elem = copy.deepcopy(self._elem, memo)
+        return new
+
+    def _copy_values(self, other: 'Transform'):
+        pool = self._pool
+        pool.translations[self._index] = other._pool.translations[other._index]
+        pool.rotations[self._index] = other._pool.rotations[other._index]
+        pool.scales[self._index] = other._pool.scales[other._index]
+        self._invalidate()
+
+    def _invalidate(self):
+        # the model matrix is rebuilt by the pool, the world matrices by the entities
+        pool = self._pool
+        pool.dirty[self._index] = True
+        pool.version += 1
+        pool.changed[self._index] = pool.version
+        if self._elem is not None and self._elem.transform is self:
+            self._elem.invalidate_world()
+
     def to_model_view_matrix(self):
-        # cache mv matrix
-        if self._mv_needs_rebuild:
-            self._mv = self._get_translation_matrix().dot(  # apply translation
-                self._get_rotation_matrix().dot(  # apply rotation
-                    self._get_scale_matrix()  # apply scaling
-                ))
-            self._mv_needs_rebuild = False
-        return self._mv
+        # a copy, safe to keep
+        return self._pool.get_matrix(self._index)
 
     def to_model_view_matrix_global(self):
-        # non-recursive, could probably be
-        mvmat = np.identity(4, dtype='float32')
+        # cached by the entity, see Entity.get_world_matrix
         if self._has_scene_element():
-            hierarchy = [self._elem]
-            ce = self._elem
-            while ce.parent is not None:
-                hierarchy.insert(0, ce.parent)
-                ce = ce.parent
-            for elem in hierarchy:
-                mvmat = mvmat.dot(elem.transform.to_model_view_matrix())
-        return mvmat
+            return self._elem.get_world_matrix()
+        return np.identity(4, dtype='float32')
 
     def _get_rotation_matrix(self):
         rot = np.zeros((4, 4), dtype='float32')
-
-        rot[:3, :3] = Rotation.from_quat(self._rotation).as_matrix()
+        rot[:3, :3] = quaternion.to_matrix(self._pool.rotations[self._index])
         rot[3, 3] = 1
         return rot
 
     def _get_translation_matrix(self):
-        trans_mat = matrix.create_translation_matrix(self._translation)
+        trans_mat = matrix.create_translation_matrix(self._pool.translations[self._index])
         return trans_mat
 
     def _get_scale_matrix(self):
-        return matrix.create_scale_matrix(*self._scale)
+        return matrix.create_scale_matrix(*self._pool.scales[self._index])
 
     def set_translation(self, trans_vec: np.ndarray):
         if not len(trans_vec) == 3:
             raise Exception("Invalid translation vector!")
-        self._mv_needs_rebuild = True
-        self._translation = trans_vec
+        self._pool.translations[self._index] = trans_vec
+        self._invalidate()
 
     def set_rotation(self, rot_quat: np.ndarray):
         if not len(rot_quat) == 4:
             raise Exception("Invalid rotation quaternion!")
-        self._mv_needs_rebuild = True
-        self._rotation = rot_quat
+        self._pool.rotations[self._index] = rot_quat
+        self._invalidate()
 
     def set_scale(self, scale_vec: np.ndarray):
         if not len(scale_vec) == 3:
             raise Exception("Invalid scale vector!")
-        self._mv_needs_rebuild = True
-        self._scale = scale_vec
+        self._pool.scales[self._index] = scale_vec
+        self._invalidate()
 
     def get_translation(self):
-        return self._translation
+        return self._pool.translations[self._index].copy()
 
     def get_rotation(self):
-        return self._rotation
+        return self._pool.rotations[self._index].copy()
 
     def get_scale(self):
-        return np.array(self._scale, dtype='float64')
+        return np.array(self._pool.scales[self._index], dtype='float64')
 
     def translate_local(self, trans_vec: np.ndarray):
         if not len(trans_vec) == 3:
@@ -98,11 +208,8 @@ class Transform:
         self.set_rotation(matrix.quaternion_from_matrix(position_mat))
 
     def clone(self):
-        new = Transform(self._elem)
-        new._translation = self._translation.copy()
-        new._scale = self._scale.copy()
-        new._rotation = self._rotation.copy()
-        new._mv_needs_rebuild = True
+        new = Transform(self._elem, self._pool)
+        new._copy_values(self)
         return new
 
     def _has_scene_element(self):
@@ -115,12 +222,13 @@ class Transform:
 
 
 class Spatial:
+    __slots__ = ('i', 'j', 'k', 'translation', 'scale')
     I = np.array([1.0, 0., 0.], dtype='float32')
     J = np.array([.0, 1., 0.], dtype='float32')
     K = np.array([.0, 0., 1.], dtype='float32')
     @staticmethod
     def quat_rot(quat, vec):  # returns vec rotated by quaternion quat
-        return vec + 2.0 * np.cross(quat[0:3], np.cross(quat[0:3], vec) + quat[3] * vec)
+        return quaternion.rotate(quat, vec)
 
     @staticmethod
     def quaternion_multiply(quaternion1, quaternion0):
@@ -204,7 +312,7 @@ class Spatial:
         return np.dot(a, b) > 1 - epsilon
     def get_quaternion(self):
         mat = self.to_matrix()[0:3,0:3]
-        return Rotation.as_quat(Rotation.from_matrix(mat))
+        return quaternion.from_matrix(mat)
 
     def transform_by_quaternion(self, quaternion):
         self.i = Spatial.quat_rot(quaternion, self.i)
@@ -213,7 +321,7 @@ class Spatial:
         self._normalize()
 
     def to_matrix(self):
-        mat = np.empty((4, 4))
+        mat = np.zeros((4, 4))
         i = self.i * self.scale[0]
         j = self.j * self.scale[1]
         k = self.k * self.scale[2]
@@ -14,19 +14,11 @@ def get_normals(vertex_data, right_hand=True):  # binary vertex data, 3 groups o
     that is, the vertices are in the order (c, b, a), (b, a, c), or (a, c, b)
     using RHR, (b - c) x (a - c) gives us the normal direction
     """
-    normals = numpy.array([], dtype='float32')
-    for ind in range(0, len(vertex_data), 9):
-        v = vertex_data[ind:ind + 9]
-        a, b, c = v[0], v[1], v[2]  # A
-        i, j, k = v[3], v[4], v[5]  # B
-        x, y, z = v[6], v[7], v[8]  # C
-        bc = (i - x, j - y, k - z)
-        ac = (a - x, b - y, c - z)
-        norm = norm_vec3(cross_array(bc, ac) if right_hand else cross_array(ac, bc))
-        normals = numpy.append(normals, norm)
-        normals = numpy.append(normals, norm)
-        normals = numpy.append(normals, norm)
-    return normals
+    triangles = numpy.asarray(vertex_data, dtype='float64').reshape(-1, 3, 3)
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    normals = numpy.cross(b - c, a - c) if right_hand else numpy.cross(a - c, b - c)
+    normals = normalize_rows(normals)
+    return numpy.repeat(normals, 3, axis=0).astype('float32').ravel()
 
 def get_normals_from_faces (normals_per_face, faces):
     # assume faces is a 2d array, not collapsed. dimensions of X by 3
@@ -78,26 +70,33 @@ def get_normals_from_obj (vertex_pos, faces):
     # assume faces is 2d array
     # returns a 2d array of normals
 
-    # need a normal per vertex
-    # a vertex's normal is determined by the normals of the faces it's connected to
-    # thus, for each vertex index:
-    #   we must look it up in the faces,
-    #   find the other vertices,
-    #   determine the normal of each triangle it's connected to,
-    #   and average all of the collected normals, and store it at that index
-    normals = []
-    vi = -1
-    for v in vertex_pos:
-        vi += 1
-        v_faces = find_faces_for_vertex(vi, faces)
-        norm = numpy.array([0, 0, 0], dtype='float32')
-        for f in v_faces:
-            n = get_normal_for_face(f, vertex_pos)
-            norm += n
-        norm /= len(v_faces) # average all the normals
-        norm = norm_vec3(norm) # normalize it
-        normals.append(norm)
-    return normals
+    # a vertex's normal is the average of the normals of the faces it's connected to, see get_vertex_normals
+    return list(get_vertex_normals(vertex_pos, faces))
+
+def get_face_normals (vertex_pos, faces, normalize=True):
+    # one normal per face, faces is an (n, 3) array of indices into vertex_pos.
+    # unnormalized, each normal's length is twice its triangle's area
+    triangles = numpy.asarray(vertex_pos, dtype='float64')[numpy.asarray(faces, dtype='int64')]
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    normals = numpy.cross(c - b, c - a)
+    return normalize_rows(normals) if normalize else normals
+
+def get_vertex_normals (vertex_pos, faces, area_weighted=False):
+    # smooth normals, one per vertex: the average of the normals of the faces around it,
+    # or the sum weighted by their areas, so small slivers count for less
+    faces = numpy.asarray(faces, dtype='int64').reshape(-1, 3)
+    face_normals = get_face_normals(vertex_pos, faces, normalize=not area_weighted)
+    sums = numpy.zeros((len(vertex_pos), 3), dtype='float64')
+    numpy.add.at(sums, faces.ravel(), numpy.repeat(face_normals, 3, axis=0))
+    if not area_weighted:
+        counts = numpy.bincount(faces.ravel(), minlength=len(vertex_pos))
+        sums /= numpy.maximum(counts, 1)[:, numpy.newaxis]
+    return normalize_rows(sums).astype('float32')
+
+def normalize_rows (vecs, epsilon=0.0001):
+    # norm_vec3 for every row of an (n, 3) array
+    mag = numpy.maximum(numpy.linalg.norm(vecs, axis=1, keepdims=True), epsilon)
+    return vecs / mag
 
 def cross(a, b, c, x, y, z):
     """
@@ -0,0 +1,33 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+from main.graphics.backend import RecordingBackend
+
+ARRAY_BUFFER = 0x8892
+
+
+def test_binds_counted_on_the_same_basis():
+    backend = RecordingBackend()
+    backend.begin_frame()
+    for _ in range(2):
+        backend.use_program(1)
+        backend.bind_vertex_array(1)
+        backend.bind_buffer(ARRAY_BUFFER, 1)
+        backend.bind_texture(0x0DE1, 1)
+    backend.bind_vertex_array(0)
+    backend.bind_buffer(ARRAY_BUFFER, 0)
+    backend.bind_buffer(ARRAY_BUFFER, 0)
+    stats = backend.end_frame()
+    assert (stats.program_switches, stats.redundant_program_binds) == (1, 1)
+    assert (stats.vao_switches, stats.redundant_vao_binds) == (2, 1)
+    assert (stats.buffer_switches, stats.redundant_buffer_binds) == (2, 2)
+    assert (stats.texture_switches, stats.redundant_texture_binds) == (1, 1)
+
+
+def test_deleting_a_bound_buffer_unbinds_it():
+    backend = RecordingBackend()
+    backend.begin_frame()
+    backend.bind_buffer(ARRAY_BUFFER, 1)
+    backend.delete_buffer(1)
+    backend.bind_buffer(ARRAY_BUFFER, 1)
+    assert backend.end_frame().buffer_switches == 2
@@ -0,0 +1,31 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+import pytest
+
+from main.lsystems import bytecode
+from main.lsystems.parser import LSystem
+
+
+def test_pop_underflow_raises():
+    stack = bytecode.TurtleStack()
+    with pytest.raises(IndexError):
+        stack.pop()
+
+
+def test_push_pop_round_trip():
+    stack = bytecode.TurtleStack(1)
+    for i in range(5):
+        stack.push(np.identity(4) * i, i)
+    for i in reversed(range(5)):
+        matrix, resource = stack.pop()
+        assert resource == i
+        assert matrix[0, 0] == i
+    assert stack.depth == 0
+
+
+def test_unbalanced_bracket_raises():
+    program = LSystem().compile_actions()
+    with pytest.raises(IndexError):
+        program.run(program.assemble('3#]+#'), [None] * 4)
@@ -0,0 +1,43 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+
+from benchmarks.bench_transform import hierarchy
+from main.core.compiled_scene import CompiledScene
+from main.core.entity import Entity
+
+
+def world_matrices(root: Entity) -> list:
+    # every entity's world matrix, walked without the compiled scene
+    matrices, stack = [], [(root, np.identity(4))]
+    while stack:
+        ent, parent = stack.pop()
+        world = parent @ ent.transform._pool.get_matrix(ent.transform._index)
+        matrices.append((ent, world))
+        stack.extend((child, world) for child in ent.children)
+    return matrices
+
+
+def test_unrelated_transform_does_not_recompute():
+    compiled = CompiledScene([hierarchy(1000, 4, np.random.default_rng(0))])
+    assert compiled.update()
+    before = compiled.world.copy()
+    camera = Entity('cam')
+    camera.transform.set_rotation(np.array([0.0, 0.5, 0.0, 1.0]))
+    assert not compiled.update()
+    assert np.array_equal(compiled.world, before)
+
+
+def test_moved_subtree_matches_a_full_walk():
+    root = hierarchy(200, 3, np.random.default_rng(0))
+    compiled = CompiledScene([root])
+    compiled.update()
+    moved = root.children[1]
+    moved.transform.set_translation(np.array([5.0, 0.0, 0.0]))
+    # reading a world matrix in between clears the entities' dirty flags, that mustn't hide the move
+    moved.children[0].transform.to_model_view_matrix_global()
+    assert compiled.update()
+    rows = {id(ent): i for i, ent in enumerate(compiled.entities)}
+    for ent, world in world_matrices(root):
+        assert np.allclose(compiled.world[rows[id(ent)]], world, atol=1e-4)
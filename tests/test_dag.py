@@ -0,0 +1,31 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+
+from main.lsystems.dag import LSystemDAG
+from main.lsystems.parser import LSystem
+
+
+def sorted_matrices(matrices: np.ndarray) -> np.ndarray:
+    # the dag and the walk place instances in different orders
+    return matrices[np.lexsort(np.round(matrices.reshape(-1, 16), 4).T)]
+
+
+def test_walk_visits_every_placement():
+    ls = LSystem()
+    ls.iterations = 4
+    ls.axiom = '[S]!!!!!S'
+    ls.rules = {'S': '3#+[&AB]****[&AB]*****[&AB]', 'A': '__3#[B]+[&AB]****[&AB]******&AB',
+                'B': '4#+1[&&#]****[&&#]****[&&#]'}
+    ls.resources = [None] * 10
+    dag = LSystemDAG(ls)
+    walked = [[] for _ in ls.resources]
+    for prototype, world in dag.walk():
+        for r, local in enumerate(prototype.instances):
+            if local is not None:
+                walked[r].append(np.matmul(world, local))
+    for batch, matrices in zip(dag.flatten(), walked):
+        assert len(batch) == sum(len(m) for m in matrices)
+        if len(batch) > 0:
+            assert np.allclose(sorted_matrices(batch.matrices), sorted_matrices(np.concatenate(matrices)), atol=1e-4)
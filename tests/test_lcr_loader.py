@@ -0,0 +1,21 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+import pytest
+
+from main.loader import lcr_loader
+
+
+@pytest.mark.parametrize('kept', [0.0, 0.1, 0.5, 0.9])
+def test_truncated_cache_is_ignored(tmp_path, kept):
+    filename = str(tmp_path / 'tree.lcr')
+    with open(filename, 'wt') as f:
+        f.write('axiom=A\n')
+    path = lcr_loader.cache_filename(filename)
+    np.savez(path, hash=np.array(lcr_loader.content_hash(filename)), instances=np.zeros((50, 4, 4), 'float32'))
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:int(len(data) * kept)])
+    assert lcr_loader.load_cache(filename) is None
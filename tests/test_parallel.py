@@ -0,0 +1,25 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+import pytest
+
+from main.lsystems import parallel
+from main.lsystems.parser import LSystem
+
+
+@pytest.mark.parametrize('sequence', ['3#[+#[-#]#]#[++##', '3[[[#]+#[-#'])
+def test_split_matches_serial(sequence):
+    program = LSystem().compile_actions()
+    codes = program.assemble(sequence)
+    serial = program.run(codes, [None] * 4)
+    split = parallel.generate_instances_split(program, codes, [None] * 4, max_workers=2)
+    for a, b in zip(serial, split):
+        assert len(a) == len(b)
+        assert np.allclose(a.matrices, b.matrices)
+
+
+def test_split_unbalanced_raises_like_serial():
+    program = LSystem().compile_actions()
+    with pytest.raises(IndexError):
+        parallel.generate_instances_split(program, program.assemble('3#]+#'), [None] * 4, max_workers=2)
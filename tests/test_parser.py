@@ -0,0 +1,44 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+
+from main.lsystems.parser import LSystem, LSystemGenerator
+from main.lsystems.rules import Production
+
+
+def tree() -> LSystem:
+    ls = LSystem()
+    ls.iterations = 4
+    ls.axiom = '[S]!!!!!S'
+    ls.rules = {'S': '3#+[&AB]****[&AB]*****[&AB]', 'A': '__3#[B]+[&AB]****[&AB]******&AB',
+                'B': '4#+1[&&#]****[&&#]****[&&#]', 'C': '#C'}
+    ls.resources = [None] * 10
+    return ls
+
+
+def same_instances(a, b) -> bool:
+    return all(len(x) == len(y) and np.allclose(x.matrices, y.matrices) for x, y in zip(a, b))
+
+
+def test_affected_letters_follow_productions():
+    ls = tree()
+    ls.rules = {**ls.rules, 'A': [Production('__3#[B]+[&AB]'), Production('B', weight=2.0)]}
+    old = dict(ls.rules)
+    ls.rules = {**ls.rules, 'B': '4#'}
+    assert ls.affected_letters(old) == {'A', 'B', 'S'}
+
+
+def test_production_is_hashable():
+    assert len({Production('A'), Production('A'), Production('B')}) == 2
+
+
+def test_rule_change_matches_fresh_derivation():
+    ls = tree()
+    generator = LSystemGenerator(ls, memoize=True)
+    generator.update()
+    ls.rules = {**ls.rules, 'B': '4#+1[&&#]****[&&#]'}
+    updated = generator.update()
+    fresh = tree()
+    fresh.rules = dict(ls.rules)
+    assert same_instances(updated, LSystemGenerator(fresh).update())
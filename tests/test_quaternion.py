@@ -0,0 +1,58 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import numpy as np
+import pytest
+
+from main.math import quaternion
+
+
+def random_quaternions(count: int) -> np.ndarray:
+    quats = np.random.default_rng(0).normal(size=(count, 4))
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def same_rotation(a: np.ndarray, b: np.ndarray, tolerance: float) -> bool:
+    # q and -q are the same rotation
+    return bool(np.all(np.abs(np.abs(np.sum(a * b, axis=1)) - 1) <= tolerance))
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('float64', 1e-12), ('float32', 1e-5)])
+def test_rotations_are_not_orthogonalized(monkeypatch, dtype, tolerance):
+    mats = quaternion.to_matrices(random_quaternions(100)).astype(dtype)
+
+    def fail(_):
+        raise AssertionError('orthogonalized a rotation matrix')
+    monkeypatch.setattr(quaternion, '_orthogonalize', fail)
+    quats = quaternion.from_matrices(mats)
+    assert quats.dtype == np.dtype(dtype)
+    for m in mats[:10]:
+        quaternion.from_matrix(m)
+    assert same_rotation(quats, random_quaternions(100), tolerance)
+
+
+def test_scaled_matrices_are_orthogonalized():
+    quats = random_quaternions(10)
+    mats = quaternion.to_matrices(quats).astype('float32') * 2
+    assert same_rotation(quaternion.from_matrices(mats), quats, 1e-5)
+    assert same_rotation(quaternion.from_matrix(mats[0])[np.newaxis], quats[:1], 1e-5)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_loop_and_numpy_agree(dtype):
+    quats = random_quaternions(1000).astype(dtype)
+    mats = quaternion._to_matrices_numpy(quats)
+    assert np.allclose(quaternion._to_matrices_loop(quats), mats, atol=1e-6)
+    assert same_rotation(quaternion._from_matrices_loop(mats), quaternion._from_matrices_numpy(mats), 1e-6)
+    other = random_quaternions(1001)[1:].astype(dtype)
+    assert np.allclose(quaternion._multiply_loop(quats, other), quaternion._multiply_numpy(quats, other), atol=1e-6)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_compiled_and_numpy_agree(dtype):
+    numba = pytest.importorskip('numba')
+    quats = random_quaternions(1000).astype(dtype)
+    mats = quaternion._to_matrices_numpy(quats)
+    assert np.allclose(numba.njit(quaternion._to_matrices_loop)(quats), mats, atol=1e-6)
+    assert same_rotation(numba.njit(quaternion._from_matrices_loop)(mats), quaternion._from_matrices_numpy(mats),
+                         1e-6)
@@ -0,0 +1,34 @@
+# the modules import each other through main.main, so it has to be imported first
+import main.main  # noqa: F401
+
+import random
+
+import pytest
+
+from main.lsystems.rules import RuleSet, Production
+
+
+def test_parametric_rules():
+    rules = RuleSet({'A(l,w)': [Production('#A(l*0.5,max(w-1,0))', condition='l > 0.1 and w != 3')],
+                     'B(x)': 'B(x+pi)'})
+    assert rules.rewrite('A(1,5)B(0)', random.Random(0)) == '#A(0.5,4.0)B(3.141592653589793)'
+
+
+@pytest.mark.parametrize('expression', ['().__class__.__base__.__subclasses__()', '__import__("os")', 'l.real',
+                                        'l[0]', '(lambda: 1)()', '"text"', 'open("file")', 'min.__call__(l)'])
+def test_expressions_cannot_run_code(expression):
+    with pytest.raises(Exception):
+        RuleSet({'A(l)': Production('#', condition=expression)})
+    with pytest.raises(Exception):
+        RuleSet({'A(l)': 'A(%s)' % expression})
+
+
+@pytest.mark.parametrize('expression', ['9**9**9', 'floor(l)**floor(l)**floor(l)', 'factorial(10**7)'])
+def test_expressions_cannot_run_for_long(expression):
+    # either refused when the rules are compiled or failing as soon as they run, never hanging
+    with pytest.raises(Exception):
+        RuleSet({'A(l)': 'A(%s)' % expression}).rewrite('A(9)', random.Random(0))
+
+
+def test_power():
+    assert RuleSet({'A(l)': 'A(l**2)'}).rewrite('A(3)', random.Random(0)) == 'A(9.0)'